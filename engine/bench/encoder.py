@@ -0,0 +1,79 @@
+import sys
+import copy
+import time
+
+import numpy as np
+from keras import backend as K
+
+from engine.generator import BatchGenerator
+from engine.model import LSTMMorphoAnalysis
+from engine.model_object import ConfigModel, ConfigTrain
+
+
+def make_batch(model: LSTMMorphoAnalysis, build_config: ConfigModel, lengths: np.array,
+               rng: np.random.RandomState):
+    n = len(lengths)
+    sentence_max_len = int(lengths.max())
+    dtypes = BatchGenerator.get_dtypes(build_config)
+    words = np.zeros((n, sentence_max_len), dtype=dtypes.word)
+    grammemes = np.zeros((n, sentence_max_len, model.grammeme_vectorizer_input.grammemes_count()), dtype=dtypes.gram)
+    chars = np.zeros((n, sentence_max_len, build_config.char_max_word_length), dtype=dtypes.char)
+    y = np.zeros((n, sentence_max_len, 1), dtype=dtypes.tag)
+    for i, length in enumerate(lengths):
+        rows = slice(sentence_max_len - length, sentence_max_len)
+        words[i, rows] = rng.randint(1, build_config.word_max_count, length)
+        grammemes[i, rows] = model.grammeme_vectorizer_input.matrix[
+            rng.randint(0, model.grammeme_vectorizer_input.size(), length)]
+        chars[i, rows, -5:] = rng.randint(1, len(model.char_set) + 1, (length, 5))
+        y[i, rows, 0] = rng.randint(1, model.grammeme_vectorizer_output.size() + 1, length)
+    padding_mask = BatchGenerator.get_padding_mask(lengths, sentence_max_len)
+    return BatchGenerator.pack_inputs(words, grammemes, chars, build_config, padding_mask), [y]
+
+
+def measure(model: LSTMMorphoAnalysis, build_config: ConfigModel, batches, repeats: int):
+    tokens = sum([int(np.count_nonzero(target[0])) for _, target in batches])
+    K.clear_session()
+    model.build(build_config)
+    inputs, target = batches[0]
+    model.train_model.train_on_batch(inputs, target)
+    model.eval_model.predict(inputs)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for inputs, target in batches:
+            model.train_model.train_on_batch(inputs, target)
+    train_speed = tokens * repeats / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for inputs, _ in batches:
+            model.eval_model.predict_on_batch(inputs)
+    predict_speed = tokens * repeats / (time.perf_counter() - start)
+    return train_speed, predict_speed
+
+
+def main(build_config_path: str = "model/build_config.json", train_config_path: str = "model/train_config.json",
+         batches_count: int = 10, batch_size: int = 64, repeats: int = 3):
+    train_config = ConfigTrain()
+    train_config.load(train_config_path)
+    build_config = ConfigModel()
+    build_config.load(build_config_path)
+    build_config.use_word_embeddings = False
+    build_config.use_word_lm = False
+    model = LSTMMorphoAnalysis()
+    model.prepare(train_config.gram_dict_input, train_config.gram_dict_output,
+                  train_config.word_vocabulary, train_config.char_set_path)
+
+    variants = [("ReversedLSTM + LSTM", False, "lstm"), ("fast LSTM", True, "lstm"), ("fast GRU", True, "gru")]
+    for name, use_fast_encoder, rnn_cell in variants:
+        config = copy.deepcopy(build_config)
+        config.use_fast_encoder = use_fast_encoder
+        config.rnn_cell = rnn_cell
+        rng = np.random.RandomState(42)
+        batches = [make_batch(model, config, rng.randint(3, 40, batch_size), rng) for _ in range(batches_count)]
+        train_speed, predict_speed = measure(model, config, batches, repeats)
+        print("{}: train {:.0f} tokens/sec, predict {:.0f} tokens/sec".format(name, train_speed, predict_speed))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
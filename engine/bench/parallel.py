@@ -0,0 +1,78 @@
+import os
+import sys
+import copy
+import json
+import shutil
+import tempfile
+
+import numpy as np
+from keras import backend as K
+
+from engine.checkpoint import TrainingState
+from engine.dop.threads import get_available_cpus
+from engine.model import LSTMMorphoAnalysis
+from engine.model_object import ConfigModel, ConfigTrain
+from engine.parallel import train_parallel
+
+
+def get_worker_counts(cpu_count: int):
+    counts = [1]
+    while counts[-1] * 2 <= cpu_count:
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def run(file_names, train_config: ConfigTrain, build_config: ConfigModel, workers_count: int, directory: str):
+    train_config = copy.deepcopy(train_config)
+    train_config.parallel_workers = workers_count
+    train_config.epochs_num = 1
+    train_config.training_state_path = None
+    train_config.telemetry_path = os.path.join(directory, "telemetry.jsonl")
+    for name in ("train_model_config_path", "train_model_weights_path",
+                 "eval_model_config_path", "eval_model_weights_path"):
+        setattr(train_config, name, os.path.join(directory, os.path.basename(getattr(train_config, name))))
+    if os.path.exists(train_config.telemetry_path):
+        os.remove(train_config.telemetry_path)
+
+    K.clear_session()
+    np.random.seed(train_config.random_seed)
+    model = LSTMMorphoAnalysis()
+    model.prepare(train_config.gram_dict_input, train_config.gram_dict_output,
+                  train_config.word_vocabulary, train_config.char_set_path, file_names, train_config.tag_cache_path)
+    model.build(build_config)
+    model.get_compiled_corpus(file_names, train_config, build_config)
+    state = TrainingState()
+    state.train_idx, state.val_idx = model.get_split(model.count_samples(file_names), train_config.val_part)
+    train_parallel(model, file_names, train_config, build_config, state)
+
+    with open(train_config.telemetry_path, "r", encoding="utf-8") as f:
+        epoch = [record for record in map(json.loads, f) if record["event"] == "epoch"][-1]
+    return epoch["train_tokens_per_sec"], model.train_model.get_weights()
+
+
+def main(file_name: str, build_config_path: str = "model/build_config.json",
+         train_config_path: str = "model/train_config.json"):
+    train_config = ConfigTrain()
+    train_config.load(train_config_path)
+    build_config = ConfigModel()
+    build_config.load(build_config_path)
+    cpu_count = len(train_config.cpu_affinity or get_available_cpus())
+
+    directory = tempfile.mkdtemp()
+    try:
+        print("{:>8} {:>12} {:>8} {:>11}".format("workers", "tokens/sec", "speedup", "efficiency"))
+        base_speed = None
+        for workers_count in get_worker_counts(cpu_count):
+            speed, weights = run([file_name], train_config, build_config, workers_count, directory)
+            base_speed = base_speed or speed
+            print("{:>8} {:>12.0f} {:>8.2f} {:>11.2f}".format(workers_count, speed, speed / base_speed,
+                                                              speed / base_speed / workers_count))
+        _, repeated_weights = run([file_name], train_config, build_config, workers_count, directory)
+        deterministic = all(np.array_equal(a, b) for a, b in zip(weights, repeated_weights))
+        print("Repeated run with {} workers is {}deterministic".format(workers_count, "" if deterministic else "NOT "))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:4])
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+from engine.precision import PRECISIONS
+
+
+def run_precision(build_config_path: str, train_config_path: str, precision: str):
+    import numpy as np
+    from engine.bench.encoder import make_batch, measure as measure_speed
+    from engine.genres import tag
+    from engine.model_object import ConfigModel, ConfigTrain
+    from engine.prediction import MorphParser
+    from engine.telemetry import Telemetry
+    from engine.test.estimate import measure as measure_quality
+
+    train_config = ConfigTrain()
+    train_config.load(train_config_path)
+    build_config = ConfigModel()
+    build_config.load(build_config_path)
+    build_config.precision = precision
+
+    directory = tempfile.mkdtemp()
+    config_path = os.path.join(directory, "build_config.json")
+    output_path = os.path.join(directory, "output_text.txt")
+    build_config.save(config_path)
+    parser = MorphParser(
+        eval_model_config_path=train_config.eval_model_config_path,
+        eval_model_weights_path=train_config.eval_model_weights_path,
+        gram_dict_input=train_config.gram_dict_input,
+        gram_dict_output=train_config.gram_dict_output,
+        word_vocabulary=train_config.word_vocabulary,
+        char_set_path=train_config.char_set_path,
+        build_config=config_path,
+        tag_cache_path=train_config.tag_cache_path)
+    start = time.perf_counter()
+    tag(parser, "engine/test/test_text.txt", output_path)
+    tag_seconds = time.perf_counter() - start
+    quality = measure_quality("engine/test/gold_text.txt", output_path, False, None)
+    weights_mb = sum([weight.nbytes for weight in parser.model.eval_model.get_weights()]) / 1024.0 ** 2
+    peak_rss_mb = Telemetry.get_peak_rss_mb()
+    os.remove(output_path)
+    os.remove(config_path)
+    os.rmdir(directory)
+
+    build_config.use_word_embeddings = False
+    build_config.use_word_lm = False
+    rng = np.random.RandomState(42)
+    batches = [make_batch(parser.model, build_config, rng.randint(3, 40, 64), rng) for _ in range(10)]
+    train_speed, predict_speed = measure_speed(parser.model, build_config, batches, 3)
+    print(json.dumps({"train": train_speed, "predict": predict_speed, "tag_seconds": tag_seconds,
+                      "tag_accuracy": quality.tag_accuracy, "pos_accuracy": quality.pos_accuracy,
+                      "weights_mb": weights_mb, "peak_rss_mb": peak_rss_mb}))
+
+
+def main(build_config_path: str = "model/build_config.json", train_config_path: str = "model/train_config.json"):
+    print("{:>15} {:>12} {:>13} {:>8} {:>10} {:>9} {:>8} {:>8}".format(
+        "precision", "train tok/s", "predict tok/s", "tag sec", "weights MB", "peak RSS", "tag acc", "POS acc"))
+    for precision in PRECISIONS:
+        output = subprocess.run([sys.executable, "-m", "engine.bench.precision", "--precision",
+                                 build_config_path, train_config_path, precision],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        peak_rss = "{:.0f}".format(result["peak_rss_mb"]) if result["peak_rss_mb"] is not None else "n/a"
+        print("{:>15} {:>12.0f} {:>13.0f} {:>8.2f} {:>10.1f} {:>9} {:>8.2f} {:>8.2f}".format(
+            precision, result["train"], result["predict"], result["tag_seconds"], result["weights_mb"],
+            peak_rss, result["tag_accuracy"], result["pos_accuracy"]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--precision":
+        run_precision(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main(*sys.argv[1:3])
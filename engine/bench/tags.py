@@ -0,0 +1,65 @@
+import sys
+import time
+from typing import List
+
+from pymorphy2 import MorphAnalyzer
+from russian_tagsets import converters
+
+from engine.preparation.tagged import convert_from_opencorpora_tag, process_gram_tag, TagCache
+
+
+def read_words(file_name: str) -> List[str]:
+    words = []
+    with open(file_name, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.strip().split("\t")
+            if len(fields) >= 2:
+                words.append(fields[1])
+    return words
+
+
+def convert_plain(converter, parses) -> List[str]:
+    names = []
+    for word, tag in parses:
+        pos, gram = convert_from_opencorpora_tag(converter, tag, word)
+        names.append(pos + "#" + process_gram_tag(gram))
+    return names
+
+
+def convert_cached(cache: TagCache, converter, parses) -> List[str]:
+    names = []
+    for word, tag in parses:
+        pos, gram = cache.convert(converter, tag, word)
+        names.append(pos + "#" + gram)
+    return names
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(file_name: str = "engine/test/test_text.txt", repeats: int = 5):
+    morph = MorphAnalyzer()
+    converter = converters.converter('opencorpora-int', 'ud14')
+    parses = [(word, parse.tag) for word in read_words(file_name) for parse in morph.parse(word)]
+    print("Parses: {}; distinct tags: {}".format(len(parses), len({str(tag) for _, tag in parses})))
+
+    cache = TagCache()
+    precompute_time, _ = measure(cache.precompute, converter, morph)
+    print("Precompute: {} tags in {:.3f} s".format(len(cache), precompute_time))
+
+    plain_time = min([measure(convert_plain, converter, parses)[0] for _ in range(repeats)])
+    cold_cache = TagCache()
+    cold_time, cold_names = measure(convert_cached, cold_cache, converter, parses)
+    warm_time = min([measure(convert_cached, cache, converter, parses)[0] for _ in range(repeats)])
+    assert cold_names == convert_plain(converter, parses)
+
+    print("Plain conversion: {:.4f} s".format(plain_time))
+    print("Cold cache: {:.4f} s ({:.1f}x)".format(cold_time, plain_time / cold_time))
+    print("Warm cache: {:.4f} s ({:.1f}x)".format(warm_time, plain_time / warm_time))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
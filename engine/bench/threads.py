@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import subprocess
+from typing import List, Tuple
+
+
+def get_layouts(cpu_count: int) -> List[Tuple[int, int]]:
+    intra = sorted({1, 2, 4, cpu_count // 2, cpu_count} - {0})
+    return [(intra_op_threads, inter_op_threads) for intra_op_threads in intra if intra_op_threads <= cpu_count
+            for inter_op_threads in (1, 2)]
+
+
+def run_layout(build_config_path: str, train_config_path: str, intra_op_threads: int, inter_op_threads: int):
+    from engine.dop.threads import configure_threads
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    import numpy as np
+    from engine.bench.encoder import make_batch, measure
+    from engine.model import LSTMMorphoAnalysis
+    from engine.model_object import ConfigModel, ConfigTrain
+
+    train_config = ConfigTrain()
+    train_config.load(train_config_path)
+    build_config = ConfigModel()
+    build_config.load(build_config_path)
+    build_config.use_word_embeddings = False
+    build_config.use_word_lm = False
+    model = LSTMMorphoAnalysis()
+    model.prepare(train_config.gram_dict_input, train_config.gram_dict_output,
+                  train_config.word_vocabulary, train_config.char_set_path)
+    rng = np.random.RandomState(42)
+    batches = [make_batch(model, build_config, rng.randint(3, 40, 64), rng) for _ in range(10)]
+    train_speed, predict_speed = measure(model, build_config, batches, 3)
+    print(json.dumps({"train": train_speed, "predict": predict_speed}))
+
+
+def main(build_config_path: str = "model/build_config.json", train_config_path: str = "model/train_config.json"):
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print("{:>6} {:>6} {:>12} {:>12}".format("intra", "inter", "train tok/s", "predict tok/s"))
+    for intra_op_threads, inter_op_threads in get_layouts(cpu_count):
+        output = subprocess.run([sys.executable, "-m", "engine.bench.threads", "--layout",
+                                 build_config_path, train_config_path, str(intra_op_threads), str(inter_op_threads)],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        speed = json.loads(output.strip().splitlines()[-1])
+        print("{:>6} {:>6} {:>12.0f} {:>12.0f}".format(intra_op_threads, inter_op_threads,
+                                                       speed["train"], speed["predict"]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--layout":
+        run_layout(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        main(*sys.argv[1:3])
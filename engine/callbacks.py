@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+from keras.callbacks import Callback
+
+from engine.generator import BatchGenerator
+from engine.telemetry import Telemetry
+
+
+class MetricsLogger(Callback):
+    def __init__(self, telemetry: Telemetry, batch_generator: BatchGenerator, freq: int = 1):
+        super().__init__()
+        self.telemetry = telemetry
+        self.batch_generator = batch_generator
+        self.freq = max(freq, 1)
+        self.epoch = 0
+        self.batch = 0
+        self.acc = []
+        self.loss = []
+        self.samples = 0
+        self.window_samples = 0
+        self.tokens = 0
+        self.batch_start_time = None
+        self.start_time = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.acc = []
+        self.loss = []
+        self.samples = 0
+        self.window_samples = 0
+        self.tokens = self.batch_generator.yielded_tokens
+        self.start_time = time.time()
+
+    def on_batch_begin(self, batch, logs=None):
+        self.batch_start_time = time.time()
+
+    def on_batch_end(self, batch, logs=None):
+        logs = logs or {}
+        self.telemetry.add_time("fit", time.time() - self.batch_start_time)
+        self.batch = batch
+        self.acc.append(logs.get('accuracy', np.nan))
+        self.loss.append(logs.get('loss', np.nan))
+        self.samples += logs.get('size', 0)
+        self.window_samples += logs.get('size', 0)
+        if len(self.acc) >= self.freq:
+            self.__flush()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.acc:
+            self.__flush()
+        elapsed = time.time() - self.start_time
+        if elapsed > 0:
+            print('{} samples in {:.1f} sec, {:.1f} samples/sec'.format(self.samples, elapsed,
+                                                                       self.samples / elapsed))
+
+    def __flush(self):
+        tokens = self.batch_generator.yielded_tokens
+        self.telemetry.add_timings(self.batch_generator.pop_timings())
+        self.telemetry.record("batch", epoch=self.epoch, batch=self.batch,
+                              accuracy=float(np.nanmean(self.acc)), loss=float(np.nanmean(self.loss)),
+                              examples=self.window_samples, tokens=tokens - self.tokens,
+                              padding_ratio=self.batch_generator.padding_ratio())
+        self.tokens = tokens
+        self.acc = []
+        self.loss = []
+        self.window_samples = 0
+
+
+class PeriodicSaver(Callback):
+    def __init__(self, save_function, freq: int):
+        super().__init__()
+        self.save_function = save_function
+        self.freq = max(freq, 1)
+        self.steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+
+    def on_batch_end(self, batch, logs=None):
+        self.steps += 1
+        if self.steps % self.freq == 0:
+            self.save_function(self.steps)
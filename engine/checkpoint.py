@@ -0,0 +1,159 @@
+import os
+import shutil
+import threading
+from typing import List
+
+import h5py
+import numpy as np
+from keras import __version__ as keras_version
+from keras import backend as K
+from keras.models import Model
+
+
+def snapshot_weights(model: Model) -> List:
+    weights = [weight for layer in model.layers for weight in layer.weights]
+    values = K.batch_get_value(weights)
+    snapshot = []
+    position = 0
+    for layer in model.layers:
+        count = len(layer.weights)
+        snapshot.append((layer.name, [weight.name for weight in layer.weights], values[position:position + count]))
+        position += count
+    return snapshot
+
+
+def write_weights(file_name: str, snapshot: List) -> None:
+    with h5py.File(file_name, "w") as f:
+        f.attrs['layer_names'] = [layer_name.encode('utf8') for layer_name, _, _ in snapshot]
+        f.attrs['backend'] = K.backend().encode('utf8')
+        f.attrs['keras_version'] = str(keras_version).encode('utf8')
+        for layer_name, weight_names, weight_values in snapshot:
+            group = f.create_group(layer_name)
+            group.attrs['weight_names'] = [name.encode('utf8') for name in weight_names]
+            for name, value in zip(weight_names, weight_values):
+                dataset = group.create_dataset(name, value.shape, dtype=value.dtype)
+                if not value.shape:
+                    dataset[()] = value
+                else:
+                    dataset[:] = value
+
+
+def write_text(file_name: str, text: str) -> None:
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "w", encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file_name, file_name)
+
+
+def link_file(source: str, destination: str) -> None:
+    tmp_file_name = destination + ".tmp"
+    if os.path.exists(tmp_file_name):
+        os.remove(tmp_file_name)
+    try:
+        os.link(source, tmp_file_name)
+    except OSError:
+        shutil.copyfile(source, tmp_file_name)
+    os.replace(tmp_file_name, destination)
+
+
+class TrainingState(object):
+    def __init__(self):
+        self.epoch = 0
+        self.batches_done = 0
+        self.steps_done = 0
+        self.train_idx = None
+        self.val_idx = None
+        self.optimizer_weights = []
+        self.random_state = None
+
+    def snapshot(self, model: Model) -> 'TrainingState':
+        state = TrainingState()
+        state.__dict__.update(self.__dict__)
+        state.optimizer_weights = K.batch_get_value(model.optimizer.weights)
+        state.random_state = np.random.get_state()
+        return state
+
+    def restore(self, model: Model) -> None:
+        if self.random_state is not None:
+            np.random.set_state(self.random_state)
+        if self.optimizer_weights:
+            model._make_train_function()
+            model.optimizer.set_weights(self.optimizer_weights)
+
+    def save(self, file_name: str) -> None:
+        arrays = {
+            "cursor": np.array([self.epoch, self.batches_done, self.steps_done], dtype=np.int64),
+            "train_idx": self.train_idx,
+            "val_idx": self.val_idx
+        }
+        if self.random_state is not None:
+            _, keys, position, has_gauss, cached_gaussian = self.random_state
+            arrays["random_keys"] = keys
+            arrays["random_position"] = np.array([position, has_gauss], dtype=np.int64)
+            arrays["random_gaussian"] = np.array([cached_gaussian], dtype=np.float64)
+        for i, weights in enumerate(self.optimizer_weights):
+            arrays["optimizer_" + str(i)] = weights
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file_name, file_name)
+
+    def load(self, file_name: str) -> None:
+        with np.load(file_name) as data:
+            self.epoch, self.batches_done, self.steps_done = [int(value) for value in data["cursor"]]
+            self.train_idx = data["train_idx"]
+            self.val_idx = data["val_idx"]
+            if "random_keys" in data:
+                position, has_gauss = [int(value) for value in data["random_position"]]
+                self.random_state = ("MT19937", data["random_keys"], position, has_gauss,
+                                     float(data["random_gaussian"][0]))
+            count = len([name for name in data.files if name.startswith("optimizer_")])
+            self.optimizer_weights = [data["optimizer_" + str(i)] for i in range(count)]
+
+
+class CheckpointWriter(object):
+    def __init__(self, keep_last: int = 1):
+        self.keep_last = keep_last
+        self.thread = None
+        self.error = None
+
+    def save(self, model: Model, weights_path: str, linked_paths: List[str] = (),
+             state: TrainingState = None, state_path: str = None) -> None:
+        snapshot = snapshot_weights(model)
+        if state is not None:
+            state = state.snapshot(model)
+        self.wait()
+        self.thread = threading.Thread(target=self.__write, args=(snapshot, weights_path, list(linked_paths),
+                                                                  state, state_path))
+        self.thread.start()
+
+    def wait(self) -> None:
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def rotate(self, weights_path: str) -> None:
+        if self.keep_last <= 1 or not os.path.exists(weights_path):
+            return
+        for i in range(self.keep_last - 1, 1, -1):
+            previous = "{}.{}".format(weights_path, i - 1)
+            if os.path.exists(previous):
+                os.replace(previous, "{}.{}".format(weights_path, i))
+        link_file(weights_path, weights_path + ".1")
+
+    def __write(self, snapshot: List, weights_path: str, linked_paths: List[str],
+                state: TrainingState, state_path: str) -> None:
+        try:
+            tmp_file_name = weights_path + ".tmp"
+            write_weights(tmp_file_name, snapshot)
+            self.rotate(weights_path)
+            os.replace(tmp_file_name, weights_path)
+            if state is not None:
+                state.save(state_path)
+            for path in linked_paths:
+                link_file(weights_path, path)
+        except Exception as e:
+            self.error = e
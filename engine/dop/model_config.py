@@ -0,0 +1,20 @@
+import json
+from typing import Callable
+
+
+def rewrite_layers(model_config: str, predicate: Callable[[dict], bool], fn: Callable[[dict], None]) -> str:
+    def visit(node):
+        if isinstance(node, list):
+            for item in node:
+                visit(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if "class_name" in node and predicate(node):
+            fn(node)
+        for value in node.values():
+            visit(value)
+
+    model_config = json.loads(model_config)
+    visit(model_config)
+    return json.dumps(model_config)
@@ -0,0 +1,27 @@
+import os
+from typing import List
+
+import tensorflow as tf
+
+PINNING_SUPPORTED = hasattr(os, "sched_setaffinity")
+
+
+def get_available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def configure_threads(intra_op_threads: int = None, inter_op_threads: int = None,
+                      cpu_affinity: List[int] = None) -> None:
+    if cpu_affinity:
+        if not PINNING_SUPPORTED:
+            raise ValueError('cpu_affinity is set, but this platform cannot pin threads to CPUs; set it to null')
+        os.sched_setaffinity(0, cpu_affinity)
+    try:
+        if intra_op_threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        print('Thread settings were not applied: {}'.format(e))
@@ -11,13 +11,16 @@ from keras.callbacks import EarlyStopping
 from keras import backend as K
 
 from engine.preparation.vocab import WordVocabulary
+from engine.preparation.char_encoder import CharEncoder
+from engine.precision import MixedDense, build_dense
+from engine.sampled_softmax import SampledSoftmax, get_head_loss, set_full_softmax
 
 
 def build_dense_chars_layer(max_word_length, char_vocab_size, char_emb_dim,
-                            hidden_dim, output_dim, dropout):
+                            hidden_dim, output_dim, dropout, compute_dtype=None):
     chars_embedding_layer = Embedding(char_vocab_size, char_emb_dim, name='chars_embeddings')
-    chars_dense_1 = Dense(hidden_dim, activation='relu')
-    chars_dense_2 = Dense(output_dim)
+    chars_dense_1 = build_dense(hidden_dim, compute_dtype, activation='relu')
+    chars_dense_2 = build_dense(output_dim, compute_dtype)
 
     def dense_layer(inp):
         if len(K.int_shape(inp)) == 3:
@@ -48,7 +51,8 @@ class CharEmbeddingsModel:
 
     def load(self, model_config_path: str, model_weights_path: str) -> None:
         with open(model_config_path, "r", encoding='utf-8') as f:
-            self.model = model_from_json(f.read())
+            self.model = model_from_json(f.read(), custom_objects={'MixedDense': MixedDense,
+                                                                   'SampledSoftmax': SampledSoftmax})
         self.model.load_weights(model_weights_path)
         self.char_layer = TimeDistributed(Model(self.model.input_layers[0].output, self.model.layers[-2].input))
 
@@ -57,16 +61,21 @@ class CharEmbeddingsModel:
               vocabulary_size: int,
               word_embeddings_dimension: int,
               max_word_length: int,
-              word_embeddings: np.array):
+              word_embeddings: np.array,
+              num_sampled: int = None):
         self.char_layer = char_layer
         chars = Input(shape=(max_word_length, ), name='chars')
 
-        output = Dense(vocabulary_size, weights=[word_embeddings], use_bias=False,
-                       trainable=False, activation='softmax')
-        output = output(Dense(word_embeddings_dimension, name='char_embed_to_word_embed')(self.char_layer(chars)))
+        if num_sampled:
+            output_layer = SampledSoftmax(vocabulary_size, num_sampled, weights=[word_embeddings.T], use_bias=False,
+                                          trainable=False)
+        else:
+            output_layer = Dense(vocabulary_size, weights=[word_embeddings], use_bias=False,
+                                 trainable=False, activation='softmax')
+        output = output_layer(Dense(word_embeddings_dimension, name='char_embed_to_word_embed')(self.char_layer(chars)))
 
         self.model = Model(inputs=chars, outputs=output)
-        self.model.compile(loss='sparse_categorical_crossentropy', optimizer=Adam())
+        self.model.compile(loss=get_head_loss(output_layer), optimizer=Adam())
         print(self.model.summary())
 
     def train(self,
@@ -89,6 +98,17 @@ class CharEmbeddingsModel:
 
         self.model.fit(chars_train, y_train, batch_size=batch_size, epochs=100, verbose=2,
                        validation_data=[chars_val, y_val], callbacks=callbacks)
+        if isinstance(self.model.layers[-1], SampledSoftmax):
+            loss, accuracy = self.evaluate_full(chars_val, y_val, batch_size)
+            print('Full softmax validation loss: {:.4f}, accuracy: {:.4f}'.format(loss, accuracy))
+
+    def evaluate_full(self, chars: np.array, y: np.array, batch_size: int) -> Tuple[float, float]:
+        model = model_from_json(set_full_softmax(self.model.to_json()),
+                                custom_objects={'MixedDense': MixedDense, 'SampledSoftmax': SampledSoftmax})
+        model.set_weights(self.model.get_weights())
+        model.compile(loss='sparse_categorical_crossentropy', optimizer=Adam(), metrics=['accuracy'])
+        loss, accuracy = model.evaluate(chars, y, batch_size=batch_size, verbose=0)
+        return loss, accuracy
 
     @staticmethod
     def get_split(sample_counter: int, val_part: float) -> Tuple[np.array, np.array]:
@@ -100,14 +120,8 @@ class CharEmbeddingsModel:
 
     @staticmethod
     def prepare_words(vocabulary, char_set, max_word_length):
-        chars = np.zeros((vocabulary.size(), max_word_length), dtype=np.int)
-        y = np.zeros((vocabulary.size(), ), dtype=np.int)
-        for i in range(vocabulary.size()):
-            y[i] = i
-        for i, word in enumerate(vocabulary.words):
-            word_char_indices = [char_set.index(ch) if ch in char_set else len(char_set)
-                                 for ch in word][-max_word_length:]
-            chars[i, -min(len(word), max_word_length):] = word_char_indices
+        chars = CharEncoder(char_set).encode_words(vocabulary.words, max_word_length)
+        y = np.arange(vocabulary.size(), dtype=np.int)
         return chars, y
 
 
@@ -121,7 +135,8 @@ def get_char_model(
         model_config_path: str,
         batch_size: int=128,
         val_part: float=0.2,
-        seed: int=42):
+        seed: int=42,
+        num_sampled: int=None):
 
     model = CharEmbeddingsModel()
     if model_config_path is not None and os.path.exists(model_config_path):
@@ -134,7 +149,8 @@ def get_char_model(
                     word_embeddings_dimension=embeddings.shape[1],
                     max_word_length=max_word_length,
                     word_embeddings=embeddings.T,
-                    char_layer=char_layer)
+                    char_layer=char_layer,
+                    num_sampled=num_sampled)
         model.train(vocabulary, char_set, val_part, seed, batch_size, max_word_length)
         if model_config_path is not None and model_weights_path is not None:
             model.save(model_config_path, model_weights_path)
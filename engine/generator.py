@@ -1,22 +1,49 @@
 from typing import List, Tuple
-from collections import namedtuple
+import time
+from collections import namedtuple, deque, defaultdict
+from itertools import islice, count
+from multiprocessing import get_all_start_methods, get_context
+from os.path import basename
 
 import nltk
 import numpy as np
 from pymorphy2 import MorphAnalyzer
 from russian_tagsets import converters
+from tqdm import tqdm
 
 from engine.preparation.vocab import WordVocabulary
 from engine.preparation.gram_vector import GrammemeVectorizer
-from engine.preparation.tagged import convert_from_opencorpora_tag, process_gram_tag
-from engine.dop.t_open import tqdm_open
+from engine.preparation.feature_cache import WordFeatureCache
+from engine.preparation.char_encoder import CharEncoder
+from engine.preparation.corpus_index import CorpusIndex
+from engine.preparation.tagged import convert_tag
 from engine.model_object import ConfigTrain, ConfigModel
 
 
-WordForm = namedtuple("WordForm", "text gram_vector_index")
+WordForm = namedtuple("WordForm", "text label")
+InputDtypes = namedtuple("InputDtypes", "word gram char tag")
+FeaturePlan = namedtuple("FeaturePlan", "words gram chars")
+FULL_FEATURE_PLAN = FeaturePlan(words=True, gram=True, chars=True)
+
+_worker_generator = None
+
+
+def _init_featurization_worker(generator_args) -> None:
+    global _worker_generator
+    _worker_generator = BatchGenerator(**generator_args)
+
+
+def _featurize_in_worker(batches):
+    tensors = [_worker_generator.to_tensor(sentences) for sentences in batches]
+    cache = _worker_generator.feature_cache
+    cache_stats = (cache.hits, cache.misses)
+    cache.reset_stats()
+    return tensors, _worker_generator.pop_timings(), cache_stats
 
 
 class BatchGenerator:
+    SEEK_FRACTION = 0.5
+
     def __init__(self, language: str,
                  file_names: List[str],
                  config: ConfigTrain,
@@ -25,59 +52,74 @@ class BatchGenerator:
                  indices: np.array,
                  word_vocabulary: WordVocabulary,
                  char_set: str,
-                 build_config: ConfigModel):
+                 build_config: ConfigModel,
+                 feature_cache: WordFeatureCache = None,
+                 compiled_corpus=None,
+                 epoch: int = 0,
+                 shard_index: int = 0,
+                 shard_count: int = 1):
         self.language = "ru"
         self.file_names = file_names
+        self.config = config
         self.batch_size = config.external_batch_size
         self.bucket_borders = config.sentence_len_groups
-        self.buckets = [list() for _ in range(len(self.bucket_borders))]
+        if config.bucket_count:
+            self.bucket_borders = self.get_bucket_borders(CorpusIndex.get_histogram(file_names), config.bucket_count,
+                                                          config.bucket_max_length)
+        self.bucket_lookup = self.get_bucket_lookup(self.bucket_borders)
+        self.buckets = [list() for _ in range(len(self.bucket_borders) + 1)]
+        self.bucket_sentences = np.zeros(len(self.buckets), dtype=np.int64)
+        self.bucket_real_tokens = np.zeros(len(self.buckets), dtype=np.int64)
+        self.bucket_padded_tokens = np.zeros(len(self.buckets), dtype=np.int64)
         self.build_config = build_config
         self.word_vocabulary = word_vocabulary
         self.char_set = char_set
+        self.char_encoder = CharEncoder(char_set)
         self.indices = indices
+        self.mask = self.get_mask(indices)
         self.grammeme_vectorizer_input = grammeme_vectorizer_input
         self.grammeme_vectorizer_output = grammeme_vectorizer_output
         self.morph = MorphAnalyzer()
         self.converter = converters.converter('opencorpora-int', 'ud14')
+        if feature_cache is None:
+            feature_cache = WordFeatureCache(config.feature_cache_size) \
+                if config.feature_cache_size is not None else WordFeatureCache()
+        self.feature_cache = feature_cache
+        self.compiled_corpus = compiled_corpus
+        self.dtypes = self.get_dtypes(build_config)
+        self.plan = self.get_feature_plan(build_config)
+        self.workers = config.featurization_workers or 0
+        if self.workers > 0 and "fork" not in get_all_start_methods():
+            raise ValueError("featurization_workers > 0 needs the fork start method, which this platform lacks; "
+                             "set featurization_workers to 0")
+        self.queue_size = max(config.prefetch_queue_size or 2, 1)
+        self.token_budget = config.batch_token_budget
+        self.seed = config.random_seed or 0
+        self.epoch = epoch
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.rng = np.random.RandomState(self.seed + epoch)
+        self.shuffle_buffer_size = config.shuffle_buffer_size
+        self.shuffle_rng = np.random.RandomState(self.seed + epoch)
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.yielded_tokens = 0
+        self.timings = defaultdict(float)
 
-    def __to_tensor(self, sentences: List[List[WordForm]]) -> Tuple[List, List]:
-        n = len(sentences)
-        grammemes_count = self.grammeme_vectorizer_input.grammemes_count()
-        sentence_max_len = max([len(sentence) for sentence in sentences])
+    def to_tensor(self, sentences: List[List[WordForm]]) -> Tuple[List, List]:
+        start = time.time()
+        if self.compiled_corpus is not None:
+            words, grammemes, chars, y = self.compiled_corpus.get_tensors(sentences, self.dtypes, self.plan)
+        else:
+            words, grammemes, chars, y = self.__featurize(sentences)
+        self.timings["featurize"] += time.time() - start
 
-        data = []
+        start = time.time()
+        padding_mask = None
+        if self.build_config.use_fast_encoder:
+            padding_mask = self.get_padding_mask([len(sentence) for sentence in sentences], y.shape[1])
+        data = self.pack_inputs(words, grammemes, chars, self.build_config, padding_mask)
         target = []
-
-        words = np.zeros((n,  sentence_max_len), dtype=np.int)
-        grammemes = np.zeros((n, sentence_max_len, grammemes_count), dtype=np.float)
-        chars = np.zeros((n, sentence_max_len, self.build_config.char_max_word_length), dtype=np.int)
-        y = np.zeros((n, sentence_max_len), dtype=np.int)
-
-        for i, sentence in enumerate(sentences):
-            word_indices, gram_vectors, char_vectors = self.get_sample(
-                [x.text for x in sentence],
-                language=self.language,
-                converter=self.converter,
-                morph=self.morph,
-                grammeme_vectorizer=self.grammeme_vectorizer_input,
-                max_word_len=self.build_config.char_max_word_length,
-                word_vocabulary=self.word_vocabulary,
-                word_count=self.build_config.word_max_count,
-                char_set=self.char_set)
-            assert len(word_indices) == len(sentence) and \
-                   len(gram_vectors) == len(sentence) and \
-                   len(char_vectors) == len(sentence)
-
-            words[i, -len(sentence):] = word_indices
-            grammemes[i, -len(sentence):] = gram_vectors
-            chars[i, -len(sentence):] = char_vectors
-            y[i, -len(sentence):] = [word.gram_vector_index + 1 for word in sentence]
-        if self.build_config.use_word_embeddings:
-            data.append(words)
-        if self.build_config.use_gram:
-            data.append(grammemes)
-        if self.build_config.use_chars:
-            data.append(chars)
         y = y.reshape(y.shape[0], y.shape[1], 1)
         target.append(y)
         if self.build_config.use_pos_lm:
@@ -94,68 +136,427 @@ class BatchGenerator:
             words_next = np.zeros_like(words)
             words_next[:, :-1] = words[:, 1:]
             target.append(words_next.reshape(words.shape[0], words.shape[1], 1))
+        self.timings["tensor"] += time.time() - start
         return data, target
 
+    def __featurize(self, sentences: List[List[WordForm]]):
+        n = len(sentences)
+        grammemes_count = self.grammeme_vectorizer_input.grammemes_count()
+        sentence_max_len = max([len(sentence) for sentence in sentences])
+
+        words = np.zeros((n,  sentence_max_len), dtype=self.dtypes.word) if self.plan.words else None
+        grammemes = np.zeros((n, sentence_max_len, grammemes_count), dtype=self.dtypes.gram) \
+            if self.plan.gram else None
+        y = np.zeros((n, sentence_max_len), dtype=self.dtypes.tag)
+
+        for i, sentence in enumerate(sentences):
+            y[i, -len(sentence):] = [word.label for word in sentence]
+            if not self.plan.words and not self.plan.gram:
+                continue
+            word_indices, gram_vectors = self.get_sample(
+                [x.text for x in sentence],
+                language=self.language,
+                converter=self.converter,
+                morph=self.morph,
+                grammeme_vectorizer=self.grammeme_vectorizer_input,
+                word_vocabulary=self.word_vocabulary,
+                word_count=self.build_config.word_max_count,
+                cache=self.feature_cache,
+                plan=self.plan)
+            if self.plan.words:
+                words[i, -len(sentence):] = word_indices
+            if self.plan.gram:
+                grammemes[i, -len(sentence):] = gram_vectors
+        chars = None
+        if self.plan.chars:
+            chars = self.char_encoder.encode_sentences([[x.text for x in sentence] for sentence in sentences],
+                                                       max_word_length=self.build_config.char_max_word_length,
+                                                       sentence_len=sentence_max_len,
+                                                       dtype=self.dtypes.char)
+        return words, grammemes, chars, y
+
+    @staticmethod
+    def get_feature_plan(build_config: ConfigModel) -> FeaturePlan:
+        return FeaturePlan(words=bool(build_config.use_word_embeddings or build_config.use_word_lm),
+                           gram=bool(build_config.use_gram),
+                           chars=bool(build_config.use_chars))
+
+    @staticmethod
+    def get_dtypes(build_config: ConfigModel) -> InputDtypes:
+        if not build_config.compact_inputs:
+            return InputDtypes(word=np.int, gram=np.float, char=np.int, tag=np.int)
+        return InputDtypes(word=np.int32, gram=np.dtype(build_config.gram_dtype or "float32"),
+                           char=np.uint16, tag=np.uint16)
+
+    @staticmethod
+    def get_padding_mask(lengths: List[int], sentence_len: int) -> np.array:
+        lengths = np.array(lengths, dtype=np.int64).reshape(-1, 1)
+        return (np.arange(sentence_len) >= sentence_len - lengths).astype(np.float32)
+
+    @staticmethod
+    def pack_inputs(words: np.array, grammemes: np.array, chars: np.array, build_config: ConfigModel,
+                    padding_mask: np.array = None) -> List:
+        data = []
+        if build_config.use_word_embeddings:
+            data.append(words)
+        if build_config.use_gram:
+            if build_config.use_sparse_gram:
+                gram_indices, gram_weights = GrammemeVectorizer.to_sparse(grammemes)
+                data.append(gram_indices)
+                data.append(gram_weights)
+            else:
+                data.append(grammemes)
+        if build_config.use_chars:
+            data.append(chars)
+        if build_config.use_fast_encoder:
+            data.append(padding_mask)
+        return data
+
     @staticmethod
     def get_sample(sentence: List[str],
                    language: str,
                    converter,
                    morph: MorphAnalyzer,
                    grammeme_vectorizer: GrammemeVectorizer,
-                   max_word_len: int,
                    word_vocabulary: WordVocabulary,
                    word_count: int,
-                   char_set: str):
-        word_char_vectors = []
-        word_gram_vectors = []
-        word_indices = []
-        for word in sentence:
-            char_indices = np.zeros(max_word_len)
-            gram_value_indices = np.zeros(grammeme_vectorizer.grammemes_count())
-            word_char_indices = [char_set.index(ch) if ch in char_set else len(char_set) for ch in word][-max_word_len:]
-            char_indices[-min(len(word), max_word_len):] = word_char_indices
-            word_char_vectors.append(char_indices)
-            word_index = word_vocabulary.word_to_index[word.lower()] if word_vocabulary.has_word(word) else word_count
-            word_index = min(word_index, word_count)
-            word_indices.append(word_index)
-            for parse in morph.parse(word):
-                pos, gram = convert_from_opencorpora_tag(converter, parse.tag, word)
-                gram = process_gram_tag(gram)
-                gram_value_indices += np.array(grammeme_vectorizer.get_vector(pos + "#" + gram))
-            sorted_grammemes = sorted(grammeme_vectorizer.all_grammemes.items(), key=lambda x: x[0])
-            index = 0
-            for category, values in sorted_grammemes:
-                mask = gram_value_indices[index:index + len(values)]
-                s = sum(mask)
-                gram_value_indices[index:index + len(values)] = mask / s if s != 0 else 0.0
-                index += len(values)
-            word_gram_vectors.append(gram_value_indices)
-
-        return word_indices, word_gram_vectors, word_char_vectors
+                   cache: WordFeatureCache = None,
+                   plan: FeaturePlan = FULL_FEATURE_PLAN):
+        features = [cache.get(word) if cache is not None else None for word in sentence]
+        missing = [i for i, word_features in enumerate(features)
+                   if word_features is None or
+                   (plan.words and word_features[0] is None) or
+                   (plan.gram and word_features[1] is None)]
+        if missing:
+            computed = BatchGenerator.get_words_features(
+                [sentence[i] for i in missing],
+                converter=converter,
+                morph=morph,
+                grammeme_vectorizer=grammeme_vectorizer,
+                word_vocabulary=word_vocabulary,
+                word_count=word_count,
+                plan=plan)
+            for i, word_features in zip(missing, computed):
+                features[i] = word_features
+                if cache is not None:
+                    cache.put(sentence[i], word_features)
+
+        word_indices = [word_features[0] for word_features in features]
+        word_gram_vectors = [word_features[1] for word_features in features]
+        return word_indices, word_gram_vectors
+
+    @staticmethod
+    def get_words_features(words: List[str],
+                           converter,
+                           morph: MorphAnalyzer,
+                           grammeme_vectorizer: GrammemeVectorizer,
+                           word_vocabulary: WordVocabulary,
+                           word_count: int,
+                           plan: FeaturePlan = FULL_FEATURE_PLAN) -> List[Tuple[int, np.array]]:
+        word_indices = [None] * len(words)
+        word_gram_vectors = [None] * len(words)
+        if plan.words:
+            for i, word in enumerate(words):
+                word_index = word_vocabulary.word_to_index[word.lower()] if word_vocabulary.has_word(word) \
+                    else word_count
+                word_indices[i] = min(word_index, word_count)
+        if plan.gram:
+            gram_names = []
+            for word in words:
+                names = []
+                for parse in morph.parse(word):
+                    pos, gram = convert_tag(converter, parse.tag, word)
+                    names.append(pos + "#" + gram)
+                gram_names.append(names)
+            word_gram_vectors = grammeme_vectorizer.normalize(grammeme_vectorizer.get_summed_vectors(gram_names))
+        return list(zip(word_indices, word_gram_vectors))
 
     def __iter__(self):
-        last_sentence = []
-        i = 0
+        for batches in self.iter_external_batches():
+            for inputs, target in batches:
+                yield inputs, target
+
+    def iter_minibatches(self, batch_size: int, skip_batches: int = 0, skip_steps: int = 0):
+        indices = (i for i in count(skip_batches) if i % self.shard_count == self.shard_index)
+        for index, batches in zip(indices, self.iter_external_batches(skip_batches)):
+            rng = np.random.RandomState([self.seed, self.epoch, index])
+            minibatches = self.__split_minibatches(batches, batch_size, rng)
+            if index == skip_batches:
+                minibatches = islice(minibatches, skip_steps, None)
+            for inputs, target in minibatches:
+                self.yielded_tokens += int(np.count_nonzero(target[0]))
+                yield inputs, target
+
+    def __split_minibatches(self, batches, batch_size: int, rng: np.random.RandomState):
+        for inputs, target in batches:
+            if self.token_budget is not None:
+                yield inputs, target
+                continue
+            rows = rng.permutation(len(target[0]))
+            for start in range(0, len(rows), batch_size):
+                batch_rows = rows[start:start + batch_size]
+                yield [x[batch_rows] for x in inputs], [y[batch_rows] for y in target]
+
+    def get_steps_plan(self, batch_size: int) -> List[int]:
+        shuffle_rng = np.random.RandomState(self.seed + self.epoch)
+        lengths = self.__iter_corpus_lengths(shuffle_rng)
+        if self.shuffle_buffer_size:
+            lengths = self.shuffle_stream(lengths, self.shuffle_buffer_size, shuffle_rng)
+        buckets = [list() for _ in range(len(self.bucket_borders) + 1)]
+        plan = []
+        for index, (_, bucket) in enumerate(self.group_by_buckets(lengths, buckets, length=int)):
+            if index % self.shard_count != self.shard_index:
+                continue
+            if self.token_budget is not None:
+                plan.append(len(self.split_by_tokens(bucket, self.token_budget, length=int)))
+            else:
+                plan.append((len(bucket) + batch_size - 1) // batch_size)
+        return plan
+
+    def iter_external_batches(self, skip: int = 0):
+        if self.workers > 0:
+            yield from self.__iter_parallel(skip)
+            return
+        for batches in self.__iter_batches(skip):
+            yield [self.to_tensor(sentences) for sentences in batches]
+
+    def __iter_parallel(self, skip: int = 0):
+        with get_context("fork").Pool(self.workers, initializer=_init_featurization_worker,
+                                        initargs=(self.get_worker_args(),)) as pool:
+            pending = deque()
+            for batches in self.__iter_batches(skip):
+                pending.append(pool.apply_async(_featurize_in_worker, (batches,)))
+                if len(pending) >= self.queue_size:
+                    yield self.__merge_worker_stats(*pending.popleft().get())
+            while pending:
+                yield self.__merge_worker_stats(*pending.popleft().get())
+
+    def __merge_worker_stats(self, tensors, timings, cache_stats):
+        for stage, seconds in timings.items():
+            self.timings[stage] += seconds
+        self.feature_cache.hits += cache_stats[0]
+        self.feature_cache.misses += cache_stats[1]
+        return tensors
+
+    def __iter_batches(self, skip: int = 0):
+        for index, (bucket_index, bucket) in enumerate(self.__iter_buckets()):
+            if self.token_budget is None:
+                batches = [bucket]
+            else:
+                batches = self.split_by_tokens(bucket, self.token_budget)
+                self.rng.shuffle(batches)
+            if index < skip or index % self.shard_count != self.shard_index:
+                continue
+            for sentences in batches:
+                real_tokens = sum([len(sentence) for sentence in sentences])
+                padded_tokens = len(sentences) * max([len(sentence) for sentence in sentences])
+                self.real_tokens += real_tokens
+                self.padded_tokens += padded_tokens
+                self.bucket_sentences[bucket_index] += len(sentences)
+                self.bucket_real_tokens[bucket_index] += real_tokens
+                self.bucket_padded_tokens[bucket_index] += padded_tokens
+            yield batches
+
+    @staticmethod
+    def split_by_tokens(sentences: List, token_budget: int, length=len) -> List[List]:
+        batches = []
+        batch = []
+        for sentence in sorted(sentences, key=length):
+            if batch and (len(batch) + 1) * length(sentence) > token_budget:
+                batches.append(batch)
+                batch = []
+            batch.append(sentence)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def padding_ratio(self) -> float:
+        if self.padded_tokens == 0:
+            return 0.0
+        return 1.0 - float(self.real_tokens) / self.padded_tokens
+
+    def bucket_stats(self) -> List[dict]:
+        stats = []
+        for index, borders in enumerate(self.bucket_borders + [None]):
+            padded_tokens = int(self.bucket_padded_tokens[index])
+            stats.append({
+                "borders": borders if borders is not None else "overflow",
+                "sentences": int(self.bucket_sentences[index]),
+                "efficiency": float(self.bucket_real_tokens[index]) / padded_tokens if padded_tokens != 0 else 1.0
+            })
+        return stats
+
+    @staticmethod
+    def get_bucket_borders(histogram: np.array, bucket_count: int, max_length: int = None) -> List[List[int]]:
+        histogram = np.asarray(histogram, dtype=np.int64)
+        if max_length is not None:
+            histogram = histogram[:max_length + 1]
+        lengths = np.flatnonzero(histogram)
+        lengths = lengths[lengths > 0]
+        if len(lengths) == 0:
+            return []
+        n = len(lengths)
+        bucket_count = min(bucket_count, n)
+        cumulative = np.concatenate([[0], np.cumsum(histogram[lengths])])
+        cost = np.full((bucket_count + 1, n + 1), np.inf)
+        cost[0][0] = 0
+        split = np.zeros((bucket_count + 1, n + 1), dtype=np.int64)
+        for j in range(1, bucket_count + 1):
+            for i in range(j, n + 1):
+                starts = np.arange(j - 1, i)
+                values = cost[j - 1][starts] + lengths[i - 1] * (cumulative[i] - cumulative[starts])
+                best = int(np.argmin(values))
+                cost[j][i] = values[best]
+                split[j][i] = starts[best]
+        ends = []
+        i = n
+        for j in range(bucket_count, 0, -1):
+            ends.append(int(lengths[i - 1]) + 1)
+            i = split[j][i]
+        ends = ends[::-1]
+        return [[start, end] for start, end in zip([1] + ends[:-1], ends)]
+
+    @staticmethod
+    def get_bucket_lookup(bucket_borders: List[List[int]]) -> np.array:
+        max_border = max([border[1] for border in bucket_borders] + [0])
+        lookup = np.full(max_border, len(bucket_borders), dtype=np.int64)
+        for index, (start, end) in reversed(list(enumerate(bucket_borders))):
+            lookup[start:end] = index
+        return lookup
+
+    def get_worker_args(self):
+        return dict(
+            language=self.language,
+            file_names=self.file_names,
+            config=self.config,
+            grammeme_vectorizer_input=self.grammeme_vectorizer_input,
+            grammeme_vectorizer_output=self.grammeme_vectorizer_output,
+            indices=np.zeros(0, dtype=np.int64),
+            word_vocabulary=self.word_vocabulary,
+            char_set=self.char_set,
+            build_config=self.build_config,
+            compiled_corpus=self.compiled_corpus)
+
+    def __iter_buckets(self):
+        yield from self.group_by_buckets(self.__iter_sentences(), self.buckets)
+
+    def group_by_buckets(self, sentences, buckets: List[List], length=len):
+        overflow_index = len(self.bucket_borders)
+        for sentence in sentences:
+            sentence_length = length(sentence)
+            if sentence_length == 0:
+                continue
+            index = self.bucket_lookup[sentence_length] if sentence_length < len(self.bucket_lookup) \
+                else overflow_index
+            bucket = buckets[index]
+            bucket.append(sentence)
+            if len(bucket) >= self.batch_size:
+                yield index, bucket
+                buckets[index] = []
+        for index, bucket in enumerate(buckets):
+            if bucket:
+                yield index, bucket
+            buckets[index] = []
+
+    def __iter_sentences(self):
+        sentences = self.__iter_timed(self.__iter_corpus_sentences(), "read")
+        if self.shuffle_buffer_size:
+            sentences = self.shuffle_stream(sentences, self.shuffle_buffer_size, self.shuffle_rng)
+        yield from sentences
+
+    def __iter_timed(self, items, stage: str):
+        items = iter(items)
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.timings[stage] += time.time() - start
+            yield item
+
+    def pop_timings(self) -> dict:
+        timings, self.timings = dict(self.timings), defaultdict(float)
+        return timings
+
+    @staticmethod
+    def shuffle_stream(items, buffer_size: int, rng: np.random.RandomState):
+        buffer = []
+        for item in items:
+            if len(buffer) < buffer_size:
+                buffer.append(item)
+                continue
+            index = rng.randint(buffer_size)
+            yield buffer[index]
+            buffer[index] = item
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter_corpus_sentences(self):
+        if self.compiled_corpus is not None:
+            selected = np.flatnonzero(self.mask[:self.compiled_corpus.sentences_count()])
+            for index in tqdm(selected, unit="sent", desc="compiled"):
+                yield self.compiled_corpus.get_span(index)
+            return
+        files = []
+        first_index = 0
         for filename in self.file_names:
-            with tqdm_open(filename, encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if len(line) == 0:
-                        if i not in self.indices:
-                            last_sentence = []
-                            i += 1
+            corpus_index = CorpusIndex.load_or_build(filename)
+            files.append((filename, corpus_index, first_index))
+            first_index += corpus_index.sentences_count()
+        if self.shuffle_buffer_size:
+            files = [files[i] for i in self.shuffle_rng.permutation(len(files))]
+        for filename, corpus_index, first_index in files:
+            count = corpus_index.sentences_count()
+            file_mask = self.mask[first_index:first_index + count]
+            selected = np.flatnonzero(file_mask)
+            if len(selected) < count * BatchGenerator.SEEK_FRACTION:
+                with tqdm(total=len(selected), unit="sent", desc=basename(filename)) as pb:
+                    for lines in corpus_index.read_sentences(selected):
+                        pb.update(1)
+                        yield self.__parse_sentence(lines)
+            else:
+                i = 0
+                lines = []
+                with open(filename, "r", encoding='utf-8') as f, \
+                        tqdm(total=len(selected), unit="sent", desc=basename(filename)) as pb:
+                    for line in f:
+                        if len(line.strip()) != 0:
+                            lines.append(line)
                             continue
-                        for index, bucket in enumerate(self.buckets):
-                            if self.bucket_borders[index][0] <= len(last_sentence) < self.bucket_borders[index][1]:
-                                bucket.append(last_sentence)
-                            if len(bucket) >= self.batch_size:
-                                yield self.__to_tensor(bucket)
-                                self.buckets[index] = []
-                        last_sentence = []
+                        if i < len(file_mask) and file_mask[i]:
+                            pb.update(1)
+                            yield self.__parse_sentence(lines)
+                        lines = []
                         i += 1
-                    else:
-                        word, _, pos, tags = line.split('\t')[0:4]
-                        gram_vector_index = self.grammeme_vectorizer_output.get_index_by_name(pos + "#" + tags)
-                        last_sentence.append(WordForm(text=word, gram_vector_index=gram_vector_index))
-        for index, bucket in enumerate(self.buckets):
-            yield self.__to_tensor(bucket)
+
+    def __iter_corpus_lengths(self, shuffle_rng: np.random.RandomState):
+        if self.compiled_corpus is not None:
+            selected = np.flatnonzero(self.mask[:self.compiled_corpus.sentences_count()])
+            yield from self.compiled_corpus.sentence_lengths[selected]
+            return
+        indices = CorpusIndex.load_all(self.file_names)
+        first_indices = np.cumsum([0] + [corpus_index.sentences_count() for corpus_index in indices])
+        order = range(len(indices))
+        if self.shuffle_buffer_size:
+            order = shuffle_rng.permutation(len(indices))
+        for i in order:
+            file_mask = self.mask[first_indices[i]:first_indices[i] + indices[i].sentences_count()]
+            yield from indices[i].lengths[np.flatnonzero(file_mask)]
+
+    def __parse_sentence(self, lines: List[str]) -> List[WordForm]:
+        sentence = []
+        for line in lines:
+            word, _, pos, tags = line.strip().split('\t')[0:4]
+            label = self.grammeme_vectorizer_output.get_label_by_name(pos + "#" + tags)
+            sentence.append(WordForm(text=word, label=label))
+        return sentence
+
+    @staticmethod
+    def get_mask(indices: np.array, sample_counter: int = None) -> np.array:
+        indices = np.asarray(indices, dtype=np.int64)
+        if sample_counter is None:
+            sample_counter = int(indices.max()) + 1 if len(indices) != 0 else 0
+        mask = np.zeros(sample_counter, dtype=np.bool_)
+        mask[indices] = True
+        return mask
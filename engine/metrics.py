@@ -0,0 +1,77 @@
+from typing import Dict
+
+import numpy as np
+
+from engine.preparation.gram_vector import GrammemeVectorizer
+
+
+class TaggingMetrics(object):
+    def __init__(self, grammeme_vectorizer_output: GrammemeVectorizer):
+        classes_count = grammeme_vectorizer_output.classes_count()
+        pos_tags = ["_"] + [grammeme_vectorizer_output.get_name_by_index(i).split("#")[0]
+                            for i in range(grammeme_vectorizer_output.size())] + ["_"]
+        self.unknown_label = grammeme_vectorizer_output.unknown_label()
+        self.pos_names = sorted(set(pos_tags))
+        pos_to_index = {pos: i for i, pos in enumerate(self.pos_names)}
+        self.class_pos = np.array([pos_to_index[pos] for pos in pos_tags], dtype=np.int64)
+        self.confusion = np.zeros((classes_count, classes_count), dtype=np.int64)
+        self.word_count = 0
+        self.word_errors = 0
+        self.sentence_count = 0
+        self.sentence_errors = 0
+
+    def update(self, y_true: np.array, y_pred: np.array) -> None:
+        y_true = y_true.reshape(y_true.shape[0], -1)
+        y_pred = y_pred.reshape(y_true.shape)
+        mask = (y_true != 0) & (y_true != self.unknown_label)
+        errors = (y_true != y_pred) & mask
+        true = y_true[mask].astype(np.int64)
+        pred = y_pred[mask].astype(np.int64)
+        classes_count = self.confusion.shape[0]
+        self.confusion += np.bincount(true * classes_count + pred,
+                                      minlength=classes_count * classes_count).reshape(self.confusion.shape)
+        self.word_count += int(mask.sum())
+        self.word_errors += int(errors.sum())
+        self.sentence_count += y_true.shape[0]
+        self.sentence_errors += int(errors.any(axis=1).sum())
+
+    def word_accuracy(self) -> float:
+        return 1.0 - float(self.word_errors) / self.word_count if self.word_count != 0 else 0.0
+
+    def sentence_accuracy(self) -> float:
+        return 1.0 - float(self.sentence_errors) / self.sentence_count if self.sentence_count != 0 else 0.0
+
+    def pos_confusion(self) -> np.array:
+        one_hot = np.zeros((len(self.class_pos), len(self.pos_names)), dtype=np.int64)
+        one_hot[np.arange(len(self.class_pos)), self.class_pos] = 1
+        return one_hot.T.dot(self.confusion).dot(one_hot)
+
+    def pos_accuracy(self) -> float:
+        confusion = self.pos_confusion()
+        total = confusion.sum()
+        return float(np.trace(confusion)) / total if total != 0 else 0.0
+
+    def per_pos(self) -> Dict[str, Dict]:
+        totals = np.bincount(self.class_pos, weights=self.confusion.sum(axis=1), minlength=len(self.pos_names))
+        correct_tags = np.bincount(self.class_pos, weights=np.diag(self.confusion), minlength=len(self.pos_names))
+        correct_pos = np.diag(self.pos_confusion())
+        result = {}
+        for i, pos in enumerate(self.pos_names):
+            if totals[i] == 0:
+                continue
+            result[pos] = {
+                "count": int(totals[i]),
+                "tag_accuracy": correct_tags[i] / totals[i],
+                "pos_accuracy": correct_pos[i] / totals[i]
+            }
+        return result
+
+    def __repr__(self):
+        lines = ["Word accuracy: {:.4f} ({} of {}); sentence accuracy: {:.4f} ({} of {}); POS accuracy: {:.4f}"
+                 .format(self.word_accuracy(), self.word_count - self.word_errors, self.word_count,
+                         self.sentence_accuracy(), self.sentence_count - self.sentence_errors, self.sentence_count,
+                         self.pos_accuracy())]
+        for pos, values in sorted(self.per_pos().items(), key=lambda x: x[1]["count"], reverse=True):
+            lines.append("{:>6}: {:>7} words, tag accuracy {:.4f}, POS accuracy {:.4f}"
+                         .format(pos, values["count"], values["tag_accuracy"], values["pos_accuracy"]))
+        return "\n".join(lines)
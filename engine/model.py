@@ -1,21 +1,35 @@
 from typing import List, Tuple
 import os
+import time
 
 import numpy as np
 from pymorphy2 import MorphAnalyzer
 from russian_tagsets import converters
-from keras.layers import Input, Embedding, Dense, LSTM, BatchNormalization, Activation, \
-    concatenate, Bidirectional, TimeDistributed, Dropout
+from keras.layers import Input, Embedding, Dense, LSTM, GRU, BatchNormalization, Activation, \
+    concatenate, Bidirectional, TimeDistributed, Dropout, Layer
 from keras.models import Model, model_from_json
 from keras.optimizers import Adam
 from keras import backend as K
+from keras import activations
 
 from engine.generator import BatchGenerator
 from engine.preparation.gram_vector import GrammemeVectorizer
 from engine.preparation.vocab import WordVocabulary
 from engine.preparation.loader import Loader
+from engine.preparation.feature_cache import WordFeatureCache
+from engine.preparation.char_encoder import CharEncoder
+from engine.preparation.compiled import CompiledCorpus
+from engine.preparation.corpus_index import CorpusIndex
+from engine.preparation.tagged import tag_cache
+from engine.metrics import TaggingMetrics
+from engine.checkpoint import CheckpointWriter, TrainingState, write_text
 from engine.embeddings import build_dense_chars_layer, get_char_model
+from engine.precision import MixedDense, build_dense, get_compute_dtype, set_eval_precision
+from engine.sampled_softmax import SampledSoftmax, get_head_loss
 from engine.model_object import ConfigModel, ConfigTrain
+from engine.telemetry import Telemetry
+from engine.callbacks import MetricsLogger, PeriodicSaver
+from engine.parallel import check_parallel_config, train_parallel
 
 
 class ReversedLSTM(LSTM):
@@ -28,6 +42,53 @@ class ReversedLSTM(LSTM):
         return K.reverse(y_rev, 1)
 
 
+class GrammemeBag(Layer):
+    def __init__(self, units, input_dim, activation=None, **kwargs):
+        super().__init__(**kwargs)
+        self.units = units
+        self.input_dim = input_dim
+        self.activation = activations.get(activation)
+
+    def build(self, input_shape):
+        self.kernel = self.add_weight(shape=(self.input_dim, self.units), initializer='glorot_uniform', name='kernel')
+        self.bias = self.add_weight(shape=(self.units,), initializer='zeros', name='bias')
+        super().build(input_shape)
+
+    def call(self, inputs, **kwargs):
+        indices, weights = inputs
+        embedded = K.gather(self.kernel, K.cast(indices, 'int32'))
+        output = K.sum(embedded * K.expand_dims(K.cast(weights, K.floatx()), -1), axis=-2)
+        return self.activation(K.bias_add(output, self.bias))
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape[0][:-1]) + (self.units,)
+
+    def get_config(self):
+        config = {'units': self.units, 'input_dim': self.input_dim,
+                  'activation': activations.serialize(self.activation)}
+        base_config = super().get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class PaddingMask(Layer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.supports_masking = True
+
+    def call(self, inputs, **kwargs):
+        return inputs[0]
+
+    def compute_mask(self, inputs, mask=None):
+        return K.not_equal(inputs[1], 0)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[0]
+
+
+CUSTOM_OBJECTS = {'ReversedLSTM': ReversedLSTM, 'GrammemeBag': GrammemeBag, 'PaddingMask': PaddingMask,
+                  'MixedDense': MixedDense, 'SampledSoftmax': SampledSoftmax}
+
+
 class LSTMMorphoAnalysis:
     def __init__(self):
         self.language = "ru"
@@ -37,12 +98,18 @@ class LSTMMorphoAnalysis:
         self.grammeme_vectorizer_output = GrammemeVectorizer()
         self.word_vocabulary = WordVocabulary()
         self.char_set = ""
+        self.char_encoder = CharEncoder(self.char_set)
+        self.feature_cache = WordFeatureCache()
+        self.checkpoint_writer = CheckpointWriter()
         self.train_model = None
         self.eval_model = None
 
     def prepare(self, gram_dump_path_input: str, gram_dump_path_output: str, word_vocabulary_dump_path: str,
                 char_set_dump_path: str,
-                file_names: List[str] = None) -> None:
+                file_names: List[str] = None,
+                tag_cache_dump_path: str = None) -> None:
+        if tag_cache_dump_path is not None:
+            tag_cache.load_or_precompute(tag_cache_dump_path, self.converter, self.morph)
         if os.path.exists(gram_dump_path_input):
             self.grammeme_vectorizer_input.load(gram_dump_path_input)
         if os.path.exists(gram_dump_path_output):
@@ -68,23 +135,29 @@ class LSTMMorphoAnalysis:
             self.char_set = loader.char_set
             with open(char_set_dump_path, 'w', encoding='utf-8') as f:
                 f.write(self.char_set)
+        self.char_encoder = CharEncoder(self.char_set)
 
     def save(self, model_config_path: str, model_weights_path: str,
-             eval_model_config_path: str, eval_model_weights_path: str):
+             eval_model_config_path: str, eval_model_weights_path: str,
+             state: TrainingState = None, state_path: str = None):
         if self.eval_model is not None:
-            with open(eval_model_config_path, "w", encoding='utf-8') as f:
-                f.write(self.eval_model.to_json())
-            self.eval_model.save_weights(eval_model_weights_path)
+            write_text(eval_model_config_path, self.eval_model.to_json())
         if self.train_model is not None:
-            with open(model_config_path, "w", encoding='utf-8') as f:
-                f.write(self.train_model.to_json())
-            self.train_model.save_weights(model_weights_path)
+            write_text(model_config_path, self.train_model.to_json())
+            linked_paths = [eval_model_weights_path] if eval_model_weights_path != model_weights_path else []
+            self.checkpoint_writer.save(self.train_model, model_weights_path, linked_paths, state, state_path)
+        elif self.eval_model is not None:
+            self.checkpoint_writer.save(self.eval_model, eval_model_weights_path)
 
     def load_train(self, config: ConfigModel, model_config_path: str = None, model_weights_path: str = None):
         with open(model_config_path, "r", encoding='utf-8') as f:
-            custom_objects = {'ReversedLSTM': ReversedLSTM}
-            self.train_model = model_from_json(f.read(), custom_objects=custom_objects)
+            self.train_model = model_from_json(f.read(), custom_objects=CUSTOM_OBJECTS)
         self.train_model.load_weights(model_weights_path)
+        classes_count = K.int_shape(self.train_model.outputs[0])[-1]
+        if classes_count != self.grammeme_vectorizer_output.classes_count():
+            raise ValueError('The saved model predicts {} tag classes, but the output vectorizer needs {}; models '
+                             'saved before unknown tags got their own class have to be retrained with '
+                             'rewrite_model'.format(classes_count, self.grammeme_vectorizer_output.classes_count()))
 
         loss = {}
         metrics = {}
@@ -107,6 +180,11 @@ class LSTMMorphoAnalysis:
             next_layer_name = 'shifted_pred_next'
             loss[prev_layer_name] = loss[next_layer_name] = 'sparse_categorical_crossentropy'
             metrics[prev_layer_name] = metrics[next_layer_name] = 'accuracy'
+        if config.use_word_lm:
+            out_layer_name = 'out_embedding'
+            loss[out_layer_name] = get_head_loss(self.train_model.get_layer(out_layer_name))
+            if not config.sampled_softmax_count:
+                metrics[out_layer_name] = 'accuracy'
         self.train_model.compile(Adam(clipnorm=5.), loss=loss, metrics=metrics)
 
         self.eval_model = Model(inputs=self.train_model.inputs, outputs=self.train_model.outputs[0])
@@ -114,13 +192,14 @@ class LSTMMorphoAnalysis:
     def load_eval(self, config: ConfigModel, eval_model_config_path: str,
                   eval_model_weights_path: str) -> None:
         with open(eval_model_config_path, "r", encoding='utf-8') as f:
-            custom_objects = {'ReversedLSTM': ReversedLSTM}
-            self.eval_model = model_from_json(f.read(), custom_objects=custom_objects)
-        self.eval_model.load_weights(eval_model_weights_path)
+            model_config = set_eval_precision(f.read(), config.precision)
+        self.eval_model = model_from_json(model_config, custom_objects=CUSTOM_OBJECTS)
+        self.eval_model.load_weights(eval_model_weights_path, by_name=True)
 
     def build(self, config: ConfigModel, word_embeddings=None):
         inputs = []
         embeddings = []
+        compute_dtype = get_compute_dtype(config.precision)
 
         if config.use_word_embeddings and word_embeddings is not None:
             words = Input(shape=(None,), name='words')
@@ -129,10 +208,22 @@ class LSTMMorphoAnalysis:
             words_embedding = Embedding(word_vocabulary_size, word_embeddings_dim, name='word_embeddings')(words)
             embeddings.append(words_embedding)
 
-        if config.use_gram:
+        if config.use_gram and config.use_sparse_gram:
+            gram_indices_input = Input(shape=(None, None), dtype='int32', name='gram_indices')
+            gram_weights_input = Input(shape=(None, None), name='gram_weights')
+            gram_weights = Dropout(config.gram_dropout)(gram_weights_input)
+            grammemes_embedding = GrammemeBag(config.gram_hidden_size,
+                                              input_dim=self.grammeme_vectorizer_input.grammemes_count(),
+                                              activation='relu', name='grammemes_bag')([gram_indices_input,
+                                                                                        gram_weights])
+            inputs.append(gram_indices_input)
+            inputs.append(gram_weights_input)
+            embeddings.append(grammemes_embedding)
+        elif config.use_gram:
             grammemes_input = Input(shape=(None, self.grammeme_vectorizer_input.grammemes_count()), name='grammemes')
             grammemes_embedding = Dropout(config.gram_dropout)(grammemes_input)
-            grammemes_embedding = Dense(config.gram_hidden_size, activation='relu')(grammemes_embedding)
+            grammemes_embedding = build_dense(config.gram_hidden_size, compute_dtype,
+                                              activation='relu')(grammemes_embedding)
             inputs.append(grammemes_input)
             embeddings.append(grammemes_embedding)
 
@@ -145,7 +236,8 @@ class LSTMMorphoAnalysis:
                 char_emb_dim=config.char_embedding_dim,
                 hidden_dim=config.char_function_hidden_size,
                 output_dim=config.char_function_output_size,
-                dropout=config.char_dropout)
+                dropout=config.char_dropout,
+                compute_dtype=compute_dtype)
             if config.use_trained_char_embeddings:
                 char_layer = get_char_model(
                     char_layer=char_layer,
@@ -154,7 +246,8 @@ class LSTMMorphoAnalysis:
                     model_config_path=config.char_model_config_path,
                     model_weights_path=config.char_model_weights_path,
                     vocabulary=self.word_vocabulary,
-                    char_set=self.char_set)
+                    char_set=self.char_set,
+                    num_sampled=config.sampled_softmax_count)
             chars_embedding = char_layer(chars_input)
             inputs.append(chars_input)
             embeddings.append(chars_embedding)
@@ -164,25 +257,37 @@ class LSTMMorphoAnalysis:
         else:
             layer = embeddings[0]
 
-        lstm_input = Dense(config.rnn_input_size, activation='relu')(layer)
-        lstm_forward_1 = LSTM(config.rnn_hidden_size, dropout=config.rnn_dropout,
-                              recurrent_dropout=config.rnn_dropout, return_sequences=True,
-                              name='LSTM_1_forward')(lstm_input)
-
-        lstm_backward_1 = ReversedLSTM(config.rnn_hidden_size, dropout=config.rnn_dropout,
-                                       recurrent_dropout=config.rnn_dropout, return_sequences=True,
-                                       name='LSTM_1_backward')(lstm_input)
-        layer = concatenate([lstm_forward_1, lstm_backward_1], name="BiLSTM_input")
-
-        for i in range(config.rnn_n_layers - 1):
-            layer = Bidirectional(LSTM(
-                config.rnn_hidden_size,
-                dropout=config.rnn_dropout,
-                recurrent_dropout=config.rnn_dropout,
-                return_sequences=True,
-                name='LSTM_' + str(i)))(layer)
-
-        layer = TimeDistributed(Dense(config.dense_size))(layer)
+        lstm_input = build_dense(config.rnn_input_size, compute_dtype, activation='relu')(layer)
+        if config.use_fast_encoder:
+            padding_mask_input = Input(shape=(None,), name='padding_mask_input')
+            inputs.append(padding_mask_input)
+            lstm_input = PaddingMask(name='padding_mask')([lstm_input, padding_mask_input])
+            lstm_forward_1, lstm_backward_1 = Bidirectional(
+                self.__build_fast_rnn(config, 'RNN_1'), merge_mode=None, name='BiRNN_1')(lstm_input)
+            layer = concatenate([lstm_forward_1, lstm_backward_1], name="BiLSTM_input")
+            layer = Dropout(config.rnn_dropout)(layer)
+            for i in range(config.rnn_n_layers - 1):
+                layer = Bidirectional(self.__build_fast_rnn(config, 'RNN_' + str(i + 2)))(layer)
+                layer = Dropout(config.rnn_dropout)(layer)
+        else:
+            lstm_forward_1 = LSTM(config.rnn_hidden_size, dropout=config.rnn_dropout,
+                                  recurrent_dropout=config.rnn_dropout, return_sequences=True,
+                                  name='LSTM_1_forward')(lstm_input)
+
+            lstm_backward_1 = ReversedLSTM(config.rnn_hidden_size, dropout=config.rnn_dropout,
+                                           recurrent_dropout=config.rnn_dropout, return_sequences=True,
+                                           name='LSTM_1_backward')(lstm_input)
+            layer = concatenate([lstm_forward_1, lstm_backward_1], name="BiLSTM_input")
+
+            for i in range(config.rnn_n_layers - 1):
+                layer = Bidirectional(LSTM(
+                    config.rnn_hidden_size,
+                    dropout=config.rnn_dropout,
+                    recurrent_dropout=config.rnn_dropout,
+                    return_sequences=True,
+                    name='LSTM_' + str(i)))(layer)
+
+        layer = TimeDistributed(build_dense(config.dense_size, compute_dtype))(layer)
         layer = TimeDistributed(Dropout(config.dense_dropout))(layer)
         layer = TimeDistributed(BatchNormalization())(layer)
         layer = TimeDistributed(Activation('relu'))(layer)
@@ -190,7 +295,7 @@ class LSTMMorphoAnalysis:
         outputs = []
         loss = {}
         metrics = {}
-        num_of_classes = self.grammeme_vectorizer_output.size() + 1
+        num_of_classes = self.grammeme_vectorizer_output.classes_count()
         out_layer_name = 'main_pred'
         outputs.append(Dense(num_of_classes, activation='softmax', name=out_layer_name)(layer))
         loss[out_layer_name] = 'sparse_categorical_crossentropy'
@@ -201,72 +306,219 @@ class LSTMMorphoAnalysis:
             next_layer_name = 'shifted_pred_next'
             prev_layer = Dense(num_of_classes, activation='softmax', name=prev_layer_name)
             next_layer = Dense(num_of_classes, activation='softmax', name=next_layer_name)
-            outputs.append(prev_layer(Dense(config.dense_size, activation='relu')(lstm_backward_1)))
-            outputs.append(next_layer(Dense(config.dense_size, activation='relu')(lstm_forward_1)))
+            outputs.append(prev_layer(build_dense(config.dense_size, compute_dtype,
+                                                  activation='relu')(lstm_backward_1)))
+            outputs.append(next_layer(build_dense(config.dense_size, compute_dtype,
+                                                  activation='relu')(lstm_forward_1)))
             loss[prev_layer_name] = loss[next_layer_name] = 'sparse_categorical_crossentropy'
             metrics[prev_layer_name] = metrics[next_layer_name] = 'accuracy'
 
         if config.use_word_lm:
             out_layer_name = 'out_embedding'
-            out_embedding = Dense(word_embeddings.shape[0],
-                                  weights=[word_embeddings.T, np.zeros(word_embeddings.shape[0])],
-                                  activation='softmax', name=out_layer_name, trainable=False)
-            outputs.append(out_embedding(Dense(word_embeddings.shape[1], activation='relu')(lstm_backward_1)))
-            outputs.append(out_embedding(Dense(word_embeddings.shape[1], activation='relu')(lstm_forward_1)))
-            loss[out_layer_name] = 'sparse_categorical_crossentropy'
-            metrics[out_layer_name] = 'accuracy'
+            if config.sampled_softmax_count:
+                out_embedding = SampledSoftmax(word_embeddings.shape[0], config.sampled_softmax_count,
+                                               weights=[word_embeddings, np.zeros(word_embeddings.shape[0])],
+                                               name=out_layer_name, trainable=False)
+            else:
+                out_embedding = Dense(word_embeddings.shape[0],
+                                      weights=[word_embeddings.T, np.zeros(word_embeddings.shape[0])],
+                                      activation='softmax', name=out_layer_name, trainable=False)
+            outputs.append(out_embedding(build_dense(word_embeddings.shape[1], compute_dtype,
+                                                     activation='relu')(lstm_backward_1)))
+            outputs.append(out_embedding(build_dense(word_embeddings.shape[1], compute_dtype,
+                                                     activation='relu')(lstm_forward_1)))
+            loss[out_layer_name] = get_head_loss(out_embedding)
+            if not config.sampled_softmax_count:
+                metrics[out_layer_name] = 'accuracy'
 
         self.train_model = Model(inputs=inputs, outputs=outputs)
         self.train_model.compile(Adam(clipnorm=5.), loss=loss, metrics=metrics)
         self.eval_model = Model(inputs=inputs, outputs=outputs[0])
         print(self.train_model.summary())
 
+    @staticmethod
+    def __build_fast_rnn(config: ConfigModel, name: str):
+        rnn = GRU if config.rnn_cell == 'gru' else LSTM
+        return rnn(config.rnn_hidden_size, dropout=config.rnn_dropout, implementation=2, return_sequences=True,
+                   name=name)
+
     def train(self, file_names: List[str], train_config: ConfigTrain, build_config: ConfigModel) -> None:
+        check_parallel_config(train_config)
         np.random.seed(train_config.random_seed)
-        sample_counter = self.count_samples(file_names)
-        train_idx, val_idx = self.get_split(sample_counter, train_config.val_part)
-        for big_epoch in range(train_config.epochs_num):
+        if train_config.feature_cache_size is not None:
+            self.feature_cache.resize(train_config.feature_cache_size)
+        self.checkpoint_writer.keep_last = train_config.checkpoint_keep_last
+        compiled_corpus = self.get_compiled_corpus(file_names, train_config, build_config)
+        state = self.load_training_state(train_config)
+        if state.train_idx is None:
+            sample_counter = self.count_samples(file_names)
+            state.train_idx, state.val_idx = self.get_split(sample_counter, train_config.val_part)
+        if train_config.parallel_workers > 1:
+            train_parallel(self, file_names, train_config, build_config, state)
+            return
+        train_idx, val_idx = state.train_idx, state.val_idx
+        validation_batches = self.get_validation_batches(file_names, val_idx, train_config, build_config,
+                                                         compiled_corpus)
+        telemetry = Telemetry(train_config.telemetry_path)
+        for big_epoch in range(state.epoch, train_config.epochs_num):
             print('Main epoch {}'.format(big_epoch))
-            batch_generator = BatchGenerator(
-                language=self.language,
-                file_names=file_names,
-                config=train_config,
-                grammeme_vectorizer_input=self.grammeme_vectorizer_input,
-                grammeme_vectorizer_output=self.grammeme_vectorizer_output,
-                build_config=build_config,
-                indices=train_idx,
-                word_vocabulary=self.word_vocabulary,
-                char_set=self.char_set)
-
-            for epoch, (inputs, target) in enumerate(batch_generator):
-                self.history = self.train_model.fit(inputs, target, batch_size=train_config.batch_size, epochs=1,
-                                                    verbose=2)
-                acc = self.history.history['accuracy']
-                loss = self.history.history['loss']
-                with open("engine/model/acc.txt", "a") as f_acc:
-                    f_acc.write(str(np.asarray(acc, dtype=float).mean()) + "\n")
-                with open("engine/model/loss.txt", "a") as f_loss:
-                    f_loss.write(str(np.asarray(loss, dtype=float).mean()) + "\n")
-
-                if epoch != 0 and epoch % train_config.dump_model_freq == 0:
-                    self.save(train_config.train_model_config_path, train_config.train_model_weights_path,
-                              train_config.eval_model_config_path, train_config.eval_model_weights_path)
-            self.evaluate(
+            self.grammeme_vectorizer_output.reset_unknown_count()
+            state.epoch = big_epoch
+            batch_generator = self.get_batch_generator(file_names, train_idx, train_config, build_config,
+                                                       compiled_corpus, big_epoch)
+            if train_config.streaming_fit:
+                self.fit_epoch(batch_generator, train_config, state, telemetry)
+            else:
+                for epoch, batches in enumerate(batch_generator.iter_external_batches(state.batches_done),
+                                                state.batches_done):
+                    telemetry.add_timings(batch_generator.pop_timings())
+                    start = time.time()
+                    if train_config.batch_token_budget is None:
+                        inputs, target = batches[0]
+                        self.history = self.train_model.fit(inputs, target, batch_size=train_config.batch_size,
+                                                            epochs=1, verbose=2)
+                        acc = self.history.history['accuracy']
+                        loss = self.history.history['loss']
+                    else:
+                        acc, loss = self.train_on_batches(batches)
+                    telemetry.add_time("fit", time.time() - start)
+
+                    state.batches_done = epoch + 1
+                    if epoch != 0 and epoch % train_config.dump_model_freq == 0:
+                        start = time.time()
+                        self.save_checkpoint(train_config, state)
+                        telemetry.add_time("checkpoint", time.time() - start)
+                    telemetry.record("batch", epoch=big_epoch, batch=epoch,
+                                     accuracy=float(np.mean(acc)), loss=float(np.mean(loss)),
+                                     examples=sum(len(target[0]) for _, target in batches),
+                                     tokens=sum(int(np.count_nonzero(target[0])) for _, target in batches),
+                                     padding_ratio=batch_generator.padding_ratio())
+            start = time.time()
+            metrics = self.evaluate(
                 file_names=file_names,
                 val_idx=val_idx,
                 train_config=train_config,
-                build_config=build_config)
+                build_config=build_config,
+                compiled_corpus=compiled_corpus,
+                batches=validation_batches)
+            telemetry.add_time("evaluate", time.time() - start)
+            telemetry.record("epoch", epoch=big_epoch, word_accuracy=metrics.word_accuracy(),
+                             sentence_accuracy=metrics.sentence_accuracy(), pos_accuracy=metrics.pos_accuracy(),
+                             padding_ratio=batch_generator.padding_ratio())
+            telemetry.flush()
+            print('Padding ratio: {:.4f}'.format(batch_generator.padding_ratio()))
+            for stats in batch_generator.bucket_stats():
+                print('Bucket {borders}: {sentences} sentences, padding efficiency {efficiency:.4f}'.format(**stats))
+            if compiled_corpus is not None and compiled_corpus.unknown_tags_count() != 0:
+                print('Unknown output tags in the compiled corpus: {}'.format(compiled_corpus.unknown_tags_count()))
+            elif self.grammeme_vectorizer_output.unknown_count() != 0:
+                print('Unknown output tags this epoch: {}'.format(self.grammeme_vectorizer_output.unknown_count()))
+            if train_config.featurization_workers:
+                print('Feature cache across workers: {} hits, {} misses, hit rate {:.4f}'.format(
+                    self.feature_cache.hits, self.feature_cache.misses, self.feature_cache.hit_rate()))
+            else:
+                print('Feature cache: {}'.format(self.feature_cache.stats()))
+            self.feature_cache.reset_stats()
+            state.epoch = big_epoch + 1
+            state.batches_done = 0
+            state.steps_done = 0
+            if train_config.training_state_path is not None:
+                self.save_checkpoint(train_config, state)
+        self.checkpoint_writer.wait()
+
+    def fit_epoch(self, batch_generator: BatchGenerator, train_config: ConfigTrain, state: TrainingState,
+                  telemetry: Telemetry) -> None:
+        plan = batch_generator.get_steps_plan(train_config.batch_size)
+        steps = sum(plan)
+        first_step = state.steps_done
+        if steps <= first_step:
+            return
+        steps_per_external_batch = max(steps // len(plan), 1)
+        skip_batches, skip_steps = self.get_cursor(plan, first_step)
+
+        def save_function(trained_steps):
+            start = time.time()
+            state.steps_done = first_step + trained_steps
+            self.save_checkpoint(train_config, state)
+            telemetry.add_time("checkpoint", time.time() - start)
+
+        callbacks = [
+            MetricsLogger(telemetry, batch_generator, freq=steps_per_external_batch),
+            PeriodicSaver(save_function, freq=train_config.dump_model_freq * steps_per_external_batch)
+        ]
+        minibatches = batch_generator.iter_minibatches(train_config.batch_size, skip_batches, skip_steps)
+        self.history = self.train_model.fit_generator(minibatches, steps_per_epoch=steps - first_step,
+                                                      initial_epoch=state.epoch, epochs=state.epoch + 1,
+                                                      callbacks=callbacks, verbose=2)
+
+    @staticmethod
+    def get_cursor(plan: List[int], steps_done: int) -> Tuple[int, int]:
+        ends = np.cumsum(plan)
+        skip_batches = int(np.searchsorted(ends, steps_done, side='right'))
+        skip_steps = steps_done - (int(ends[skip_batches - 1]) if skip_batches != 0 else 0)
+        return skip_batches, skip_steps
+
+    def save_checkpoint(self, train_config: ConfigTrain, state: TrainingState) -> None:
+        self.save(train_config.train_model_config_path, train_config.train_model_weights_path,
+                  train_config.eval_model_config_path, train_config.eval_model_weights_path,
+                  state if train_config.training_state_path is not None else None,
+                  train_config.training_state_path)
+
+    def load_training_state(self, train_config: ConfigTrain) -> TrainingState:
+        state = TrainingState()
+        if train_config.training_state_path is None or train_config.rewrite_model or \
+                not os.path.exists(train_config.training_state_path):
+            return state
+        state.load(train_config.training_state_path)
+        state.restore(self.train_model)
+        print('Resuming from epoch {}, batch {}, step {}'.format(state.epoch, state.batches_done, state.steps_done))
+        return state
+
+    def get_batch_generator(self, file_names: List[str], indices: np.array, train_config: ConfigTrain,
+                            build_config: ConfigModel, compiled_corpus: CompiledCorpus = None,
+                            epoch: int = 0, shard_index: int = 0, shard_count: int = 1) -> BatchGenerator:
+        return BatchGenerator(
+            language=self.language,
+            file_names=file_names,
+            config=train_config,
+            grammeme_vectorizer_input=self.grammeme_vectorizer_input,
+            grammeme_vectorizer_output=self.grammeme_vectorizer_output,
+            build_config=build_config,
+            indices=indices,
+            word_vocabulary=self.word_vocabulary,
+            char_set=self.char_set,
+            feature_cache=self.feature_cache,
+            compiled_corpus=compiled_corpus,
+            epoch=epoch,
+            shard_index=shard_index,
+            shard_count=shard_count)
+
+    def train_on_batches(self, batches: List[Tuple[List, List]]) -> Tuple[List[float], List[float]]:
+        acc = []
+        loss = []
+        for inputs, target in batches:
+            values = self.train_model.train_on_batch(inputs, target)
+            values = dict(zip(self.train_model.metrics_names, np.atleast_1d(values)))
+            acc.append(values['accuracy'])
+            loss.append(values['loss'])
+        print('{} minibatches - loss: {:.4f} - accuracy: {:.4f}'.format(len(batches), np.mean(loss), np.mean(acc)))
+        return acc, loss
+
+    def get_compiled_corpus(self, file_names: List[str], train_config: ConfigTrain, build_config: ConfigModel):
+        if train_config.compiled_corpus_dir is None:
+            return None
+        return CompiledCorpus.load_or_compile(
+            directory=train_config.compiled_corpus_dir,
+            file_names=file_names,
+            grammeme_vectorizer_input=self.grammeme_vectorizer_input,
+            grammeme_vectorizer_output=self.grammeme_vectorizer_output,
+            word_vocabulary=self.word_vocabulary,
+            char_set=self.char_set,
+            build_config=build_config)
 
     @staticmethod
     def count_samples(file_names: List[str]):
-        sample_counter = 0
-        for filename in file_names:
-            with open(filename, "r", encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if len(line) == 0:
-                        sample_counter += 1
-        return sample_counter
+        return CorpusIndex.count_sentences(file_names)
 
     @staticmethod
     def get_split(sample_counter: int, val_part: float) -> Tuple[np.array, np.array]:
@@ -276,40 +528,23 @@ class LSTMMorphoAnalysis:
         val_idx = perm[border:]
         return train_idx, val_idx
 
-    def evaluate(self, file_names, val_idx, train_config: ConfigTrain, build_config: ConfigModel) -> None:
-        word_count = 0
-        word_errors = 0
-        sentence_count = 0
-        sentence_errors = 0
-        batch_generator = BatchGenerator(
-            language=self.language,
-            file_names=file_names,
-            config=train_config,
-            grammeme_vectorizer_input=self.grammeme_vectorizer_input,
-            grammeme_vectorizer_output=self.grammeme_vectorizer_output,
-            build_config=build_config,
-            indices=val_idx,
-            word_vocabulary=self.word_vocabulary,
-            char_set=self.char_set)
-        for epoch, (inputs, target) in enumerate(batch_generator):
+    def evaluate(self, file_names, val_idx, train_config: ConfigTrain, build_config: ConfigModel,
+                 compiled_corpus: CompiledCorpus = None, batches: List[Tuple[List, List]] = None) -> TaggingMetrics:
+        metrics = TaggingMetrics(self.grammeme_vectorizer_output)
+        if batches is None:
+            batches = self.get_batch_generator(file_names, val_idx, train_config, build_config, compiled_corpus)
+        for inputs, target in batches:
             predicted_y = self.eval_model.predict(inputs, batch_size=train_config.batch_size, verbose=0)
-            for i, sentence in enumerate(target[0]):
-                sentence_has_errors = False
-                count_zero = sum([1 for num in sentence if num == [0]])
-                real_sentence_tags = sentence[count_zero:]
-                answer = []
-                for grammeme_probs in predicted_y[i][count_zero:]:
-                    num = np.argmax(grammeme_probs)
-                    answer.append(num)
-                for tag, predicted_tag in zip(real_sentence_tags, answer):
-                    tag = tag[0]
-                    word_count += 1
-                    if tag != predicted_tag:
-                        word_errors += 1
-                        sentence_has_errors = True
-                sentence_count += 1
-                if sentence_has_errors:
-                    sentence_errors += 1
+            metrics.update(target[0], np.argmax(predicted_y, axis=-1))
+        print(metrics)
+        return metrics
+
+    def get_validation_batches(self, file_names: List[str], val_idx: np.array, train_config: ConfigTrain,
+                               build_config: ConfigModel,
+                               compiled_corpus: CompiledCorpus = None) -> List[Tuple[List, List]]:
+        if train_config.val_max_sentences is not None:
+            val_idx = val_idx[:train_config.val_max_sentences]
+        return list(self.get_batch_generator(file_names, val_idx, train_config, build_config, compiled_corpus))
 
     def predict_probabilities(self, sentences: List[List[str]], batch_size: int, build_config: ConfigModel) -> List[
         List[List[float]]]:
@@ -317,34 +552,38 @@ class LSTMMorphoAnalysis:
         if max_sentence_len == 0:
             return [[] for _ in sentences]
         n_samples = len(sentences)
+        dtypes = BatchGenerator.get_dtypes(build_config)
+        plan = BatchGenerator.get_feature_plan(build_config)
 
-        words = np.zeros((n_samples, max_sentence_len), dtype=np.int)
+        words = np.zeros((n_samples, max_sentence_len), dtype=dtypes.word) if plan.words else None
         grammemes = np.zeros((n_samples, max_sentence_len, self.grammeme_vectorizer_input.grammemes_count()),
-                             dtype=np.float)
-        chars = np.zeros((n_samples, max_sentence_len, build_config.char_max_word_length), dtype=np.int)
+                             dtype=dtypes.gram) if plan.gram else None
 
         for i, sentence in enumerate(sentences):
-            if not sentence:
+            if not sentence or not (plan.words or plan.gram):
                 continue
-            word_indices, gram_vectors, char_vectors = BatchGenerator.get_sample(
+            word_indices, gram_vectors = BatchGenerator.get_sample(
                 sentence,
                 language=self.language,
                 converter=self.converter,
                 morph=self.morph,
                 grammeme_vectorizer=self.grammeme_vectorizer_input,
-                max_word_len=build_config.char_max_word_length,
                 word_vocabulary=self.word_vocabulary,
                 word_count=build_config.word_max_count,
-                char_set=self.char_set)
-            words[i, -len(sentence):] = word_indices
-            grammemes[i, -len(sentence):] = gram_vectors
-            chars[i, -len(sentence):] = char_vectors
-
-        inputs = []
-        if build_config.use_word_embeddings:
-            inputs.append(words)
-        if build_config.use_gram:
-            inputs.append(grammemes)
-        if build_config.use_chars:
-            inputs.append(chars)
+                cache=self.feature_cache,
+                plan=plan)
+            if plan.words:
+                words[i, -len(sentence):] = word_indices
+            if plan.gram:
+                grammemes[i, -len(sentence):] = gram_vectors
+
+        chars = None
+        if plan.chars:
+            chars = self.char_encoder.encode_sentences(sentences, max_word_length=build_config.char_max_word_length,
+                                                       sentence_len=max_sentence_len, dtype=dtypes.char)
+        padding_mask = None
+        if build_config.use_fast_encoder:
+            padding_mask = BatchGenerator.get_padding_mask([len(sentence) for sentence in sentences],
+                                                           max_sentence_len)
+        inputs = BatchGenerator.pack_inputs(words, grammemes, chars, build_config, padding_mask)
         return self.eval_model.predict(inputs, batch_size=batch_size)
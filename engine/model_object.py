@@ -29,6 +29,13 @@ class ConfigModel(object):
         self.use_crf = None
         self.use_pos_lm = None
         self.use_word_lm = None
+        self.compact_inputs = False
+        self.gram_dtype = None
+        self.use_sparse_gram = False
+        self.use_fast_encoder = False
+        self.rnn_cell = "lstm"
+        self.precision = "float32"
+        self.sampled_softmax_count = None
         if self.use_word_lm:
             assert not self.use_word_embeddings
 
@@ -53,14 +60,36 @@ class ConfigTrain(object):
         self.gram_dict_output = None
         self.word_vocabulary = None
         self.char_set_path = None
+        self.tag_cache_path = None
+        self.telemetry_path = None
         self.rewrite_model = True
         self.external_batch_size = None
         self.batch_size = None
         self.sentence_len_groups = None
+        self.bucket_count = None
+        self.bucket_max_length = None
         self.val_part = None
+        self.val_max_sentences = None
         self.epochs_num = None
         self.dump_model_freq = None
+        self.checkpoint_keep_last = 1
+        self.training_state_path = None
         self.random_seed = None
+        self.feature_cache_size = None
+        self.compiled_corpus_dir = None
+        # Featurization worker processes are forked, so this must stay 0 where fork is unavailable (Windows).
+        self.featurization_workers = 0
+        self.prefetch_queue_size = 2
+        self.batch_token_budget = None
+        self.shuffle_buffer_size = None
+        self.streaming_fit = False
+        self.intra_op_threads = None
+        self.inter_op_threads = None
+        # CPU pinning needs os.sched_setaffinity (Linux); elsewhere this must stay null.
+        self.cpu_affinity = None
+        # Parallel workers are POSIX subprocesses; values above 1 are rejected on Windows.
+        self.parallel_workers = 1
+        self.parallel_sync_steps = 8
 
     def save(self, filename):
         with open(filename, 'w', encoding='utf-8') as f:
@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import pickle
+import shutil
+import socket
+import tempfile
+import subprocess
+from itertools import islice, count
+from multiprocessing.connection import Connection
+from typing import List, Tuple
+
+import numpy as np
+
+from engine.checkpoint import TrainingState
+from engine.dop.threads import PINNING_SUPPORTED, configure_threads, get_available_cpus
+from engine.model_object import ConfigModel, ConfigTrain
+from engine.telemetry import Telemetry
+
+SHARED_MEMORY_DIR = "/dev/shm"
+# Workers inherit their socket through pass_fds, which only POSIX supports.
+PARALLEL_SUPPORTED = os.name == "posix"
+COUNTERS = ("steps", "examples", "tokens", "accuracy", "loss")
+
+
+class WeightAverager(object):
+    def __init__(self, connection: Connection, buffer_path: str, worker_index: int, workers_count: int, size: int):
+        self.connection = connection
+        self.buffers = np.memmap(buffer_path, dtype=np.float32, mode="r+", shape=(2, workers_count, size))
+        self.worker_index = worker_index
+        self.workers_count = workers_count
+        self.rounds = 0
+
+    def average(self, weights: List[np.array], counters: np.array) -> Tuple[List[np.array], np.array]:
+        buffer = self.buffers[self.rounds % 2]
+        self.rounds += 1
+        buffer[self.worker_index] = np.concatenate([weight.ravel() for weight in weights])
+        self.connection.send(counters)
+        counters = self.connection.recv()
+        steps = counters[:, 0]
+        if steps.sum() != 0:
+            average = np.zeros(buffer.shape[1], dtype=np.float64)
+            for row, row_steps in zip(buffer, steps):
+                if row_steps != 0:
+                    average += row * (row_steps / steps.sum())
+            weights = self.unflatten(average.astype(np.float32), weights)
+        return weights, counters.sum(axis=0)
+
+    @staticmethod
+    def unflatten(flat: np.array, weights: List[np.array]) -> List[np.array]:
+        result = []
+        position = 0
+        for weight in weights:
+            result.append(flat[position:position + weight.size].reshape(weight.shape).astype(weight.dtype))
+            position += weight.size
+        return result
+
+
+def get_worker_cpus(worker_index: int, workers_count: int, cpus: List[int]) -> List[int]:
+    return [int(cpu) for cpu in np.array_split(sorted(cpus), workers_count)[worker_index]]
+
+
+def check_parallel_config(train_config: ConfigTrain) -> None:
+    if train_config.parallel_workers > 1 and not PARALLEL_SUPPORTED:
+        raise ValueError("parallel_workers > 1 needs POSIX worker processes, which this platform lacks; "
+                         "set parallel_workers to 1")
+
+
+def train_parallel(model, file_names: List[str], train_config: ConfigTrain, build_config: ConfigModel,
+                   state: TrainingState) -> None:
+    check_parallel_config(train_config)
+    workers_count = train_config.parallel_workers
+    if state.batches_done != 0 or state.steps_done != 0:
+        print('Parallel training restarts epoch {} from its first batch'.format(state.epoch))
+        state.batches_done = 0
+        state.steps_done = 0
+    model.save_checkpoint(train_config, state)
+    model.checkpoint_writer.wait()
+    size = sum(weight.size for weight in model.train_model.get_weights())
+    directory = tempfile.mkdtemp(dir=SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None)
+    try:
+        job = dict(file_names=file_names, train_config=train_config, build_config=build_config, state=state,
+                   buffer_path=os.path.join(directory, "weights.bin"), size=size)
+        np.memmap(job["buffer_path"], dtype=np.float32, mode="w+", shape=(2, workers_count, size)).flush()
+        job_path = os.path.join(directory, "job.pkl")
+        with open(job_path, "wb") as f:
+            pickle.dump(job, f)
+
+        processes = []
+        connections = []
+        try:
+            for worker_index in range(workers_count):
+                parent_socket, child_socket = socket.socketpair()
+                processes.append(subprocess.Popen([sys.executable, "-m", "engine.parallel", job_path,
+                                                   str(worker_index), str(child_socket.fileno())],
+                                                  pass_fds=(child_socket.fileno(),)))
+                child_socket.close()
+                connections.append(Connection(parent_socket.detach()))
+            try:
+                reduce_counters(connections)
+            except (EOFError, ConnectionError):
+                raise RuntimeError('A parallel training worker exited unexpectedly, exit codes: {}'.format(
+                    [process.poll() for process in processes]))
+            exit_codes = [process.wait() for process in processes]
+            if any(code != 0 for code in exit_codes):
+                raise RuntimeError('Parallel training workers failed, exit codes: {}'.format(exit_codes))
+        finally:
+            for connection in connections:
+                connection.close()
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    model.train_model.load_weights(train_config.train_model_weights_path)
+
+
+def reduce_counters(connections: List[Connection]) -> None:
+    while True:
+        counters = [connection.recv() for connection in connections]
+        if all(worker_counters is None for worker_counters in counters):
+            return
+        if any(worker_counters is None for worker_counters in counters):
+            raise RuntimeError('Parallel training workers are out of step')
+        counters = np.array(counters)
+        for connection in connections:
+            connection.send(counters)
+
+
+def train_shard(model, file_names: List[str], train_config: ConfigTrain, build_config: ConfigModel,
+                state: TrainingState, averager: WeightAverager) -> None:
+    is_chief = averager.worker_index == 0
+    telemetry = Telemetry(train_config.telemetry_path if is_chief else None)
+    sync_steps = max(train_config.parallel_sync_steps or 1, 1)
+    compiled_corpus = model.get_compiled_corpus(file_names, train_config, build_config)
+    validation_batches = None
+    if is_chief:
+        validation_batches = model.get_validation_batches(file_names, state.val_idx, train_config, build_config,
+                                                          compiled_corpus)
+    for big_epoch in range(state.epoch, train_config.epochs_num):
+        if is_chief:
+            print('Main epoch {}'.format(big_epoch))
+        state.epoch = big_epoch
+        batch_generator = model.get_batch_generator(file_names, state.train_idx, train_config, build_config,
+                                                    compiled_corpus, big_epoch, averager.worker_index,
+                                                    averager.workers_count)
+        minibatches = batch_generator.iter_minibatches(train_config.batch_size)
+        epoch_start = time.time()
+        epoch_tokens = 0
+        for sync_round in count():
+            counters = np.zeros(len(COUNTERS))
+            for inputs, target in islice(minibatches, sync_steps):
+                start = time.time()
+                values = model.train_model.train_on_batch(inputs, target)
+                telemetry.add_time("fit", time.time() - start)
+                values = dict(zip(model.train_model.metrics_names, np.atleast_1d(values)))
+                counters += [1, len(target[0]), np.count_nonzero(target[0]), values['accuracy'], values['loss']]
+            telemetry.add_timings(batch_generator.pop_timings())
+            start = time.time()
+            weights, totals = averager.average(model.train_model.get_weights(), counters)
+            telemetry.add_time("sync", time.time() - start)
+            if totals[0] == 0:
+                break
+            model.train_model.set_weights(weights)
+            epoch_tokens += int(totals[2])
+            telemetry.record("batch", epoch=big_epoch, batch=sync_round, accuracy=totals[3] / totals[0],
+                             loss=totals[4] / totals[0], examples=int(totals[1]), tokens=int(totals[2]),
+                             padding_ratio=batch_generator.padding_ratio(), workers=averager.workers_count)
+        train_seconds = time.time() - epoch_start
+        if not is_chief:
+            continue
+
+        print('{} workers: {} tokens in {:.1f} sec, {:.0f} tokens/sec'.format(
+            averager.workers_count, epoch_tokens, train_seconds, epoch_tokens / train_seconds))
+        start = time.time()
+        metrics = model.evaluate(
+            file_names=file_names,
+            val_idx=state.val_idx,
+            train_config=train_config,
+            build_config=build_config,
+            compiled_corpus=compiled_corpus,
+            batches=validation_batches)
+        telemetry.add_time("evaluate", time.time() - start)
+        state.epoch = big_epoch + 1
+        start = time.time()
+        model.save_checkpoint(train_config, state)
+        telemetry.add_time("checkpoint", time.time() - start)
+        telemetry.record("epoch", epoch=big_epoch, workers=averager.workers_count, train_seconds=train_seconds,
+                         train_tokens=epoch_tokens, train_tokens_per_sec=epoch_tokens / train_seconds,
+                         word_accuracy=metrics.word_accuracy(), sentence_accuracy=metrics.sentence_accuracy(),
+                         pos_accuracy=metrics.pos_accuracy())
+        telemetry.flush()
+    model.checkpoint_writer.wait()
+
+
+def run_worker(job_path: str, worker_index: int, connection: Connection) -> None:
+    with open(job_path, "rb") as f:
+        job = pickle.load(f)
+    train_config, build_config, state = job["train_config"], job["build_config"], job["state"]
+    workers_count = train_config.parallel_workers
+    cpus = get_worker_cpus(worker_index, workers_count, train_config.cpu_affinity or get_available_cpus())
+    if not PINNING_SUPPORTED and worker_index == 0:
+        print('CPU pinning is not supported on this platform, parallel workers are not pinned')
+    configure_threads(train_config.intra_op_threads or len(cpus) or None, train_config.inter_op_threads,
+                      cpus if PINNING_SUPPORTED else None)
+
+    from engine.model import LSTMMorphoAnalysis
+    np.random.seed((train_config.random_seed or 0) + worker_index)
+    model = LSTMMorphoAnalysis()
+    model.prepare(train_config.gram_dict_input, train_config.gram_dict_output,
+                  train_config.word_vocabulary, train_config.char_set_path, job["file_names"],
+                  train_config.tag_cache_path)
+    model.load_train(build_config, train_config.train_model_config_path, train_config.train_model_weights_path)
+    state.restore(model.train_model)
+    averager = WeightAverager(connection, job["buffer_path"], worker_index, workers_count, job["size"])
+    train_shard(model, job["file_names"], train_config, build_config, state, averager)
+    connection.send(None)
+    connection.close()
+
+
+if __name__ == "__main__":
+    run_worker(sys.argv[1], int(sys.argv[2]), Connection(int(sys.argv[3])))
@@ -0,0 +1,73 @@
+from keras.layers import Dense, InputSpec
+from keras import backend as K
+
+from engine.dop.model_config import rewrite_layers
+
+PRECISIONS = {"float32": None, "mixed_float16": "float16", "mixed_bfloat16": "bfloat16"}
+REDUCED_WEIGHTS_DTYPE = "float16"
+
+
+class MixedDense(Dense):
+    def __init__(self, units, compute_dtype="bfloat16", reduced_weights=False, **kwargs):
+        super().__init__(units, **kwargs)
+        self.compute_dtype = compute_dtype
+        self.reduced_weights = reduced_weights
+
+    def build(self, input_shape):
+        dtype = REDUCED_WEIGHTS_DTYPE if self.reduced_weights else K.floatx()
+        input_dim = input_shape[-1]
+        self.kernel = self.add_weight(shape=(input_dim, self.units), initializer=self.kernel_initializer,
+                                      name='kernel', regularizer=self.kernel_regularizer,
+                                      constraint=self.kernel_constraint, dtype=dtype)
+        if self.use_bias:
+            self.bias = self.add_weight(shape=(self.units,), initializer=self.bias_initializer, name='bias',
+                                        regularizer=self.bias_regularizer, constraint=self.bias_constraint,
+                                        dtype=dtype)
+        else:
+            self.bias = None
+        self.input_spec = InputSpec(min_ndim=2, axes={-1: input_dim})
+        self.built = True
+
+    def call(self, inputs):
+        output = K.dot(K.cast(inputs, self.compute_dtype), K.cast(self.kernel, self.compute_dtype))
+        output = K.cast(output, K.floatx())
+        if self.use_bias:
+            output = K.bias_add(output, K.cast(self.bias, K.floatx()))
+        if self.activation is not None:
+            output = self.activation(output)
+        return output
+
+    def get_config(self):
+        config = {'compute_dtype': self.compute_dtype, 'reduced_weights': self.reduced_weights}
+        base_config = super().get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+def get_compute_dtype(precision: str):
+    assert precision in PRECISIONS, "Unknown precision: {}".format(precision)
+    return PRECISIONS[precision]
+
+
+def build_dense(units, compute_dtype=None, **kwargs):
+    if compute_dtype is None:
+        return Dense(units, **kwargs)
+    return MixedDense(units, compute_dtype=compute_dtype, **kwargs)
+
+
+def set_eval_precision(model_config: str, precision: str) -> str:
+    compute_dtype = get_compute_dtype(precision)
+
+    def is_hidden_dense(node):
+        return node["class_name"] in ("Dense", "MixedDense") and node["config"].get("activation") != "softmax"
+
+    def set_precision(node):
+        config = node["config"]
+        config.pop("compute_dtype", None)
+        config.pop("reduced_weights", None)
+        node["class_name"] = "Dense"
+        if compute_dtype is not None:
+            node["class_name"] = "MixedDense"
+            config["compute_dtype"] = compute_dtype
+            config["reduced_weights"] = True
+
+    return rewrite_layers(model_config, is_hidden_dense, set_precision)
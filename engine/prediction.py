@@ -5,9 +5,10 @@ from pymorphy2 import MorphAnalyzer
 from russian_tagsets import converters
 
 from engine.model import LSTMMorphoAnalysis
-from engine.preparation.tagged import convert_from_opencorpora_tag, process_gram_tag
+from engine.preparation.tagged import convert_tag
 from engine.preparation.form import WordFormOut
 from engine.model_object import ConfigModel
+from engine.dop.threads import configure_threads
 
 
 class Predictor:
@@ -22,14 +23,17 @@ class Predictor:
 class MorphParser(Predictor):
     def __init__(self, eval_model_config_path: str = None, eval_model_weights_path: str = None,
                  gram_dict_input: str = None, gram_dict_output: str = None, word_vocabulary: str = None,
-                 char_set_path: str = None, build_config: str = None):
+                 char_set_path: str = None, build_config: str = None, tag_cache_path: str = None,
+                 intra_op_threads: int = None, inter_op_threads: int = None, cpu_affinity: List[int] = None):
+        configure_threads(intra_op_threads, inter_op_threads, cpu_affinity)
 
         self.converter = converters.converter('opencorpora-int', 'ud14')
         self.morph = MorphAnalyzer()
         self.build_config = ConfigModel()
         self.build_config.load(build_config)
         self.model = LSTMMorphoAnalysis()
-        self.model.prepare(gram_dict_input, gram_dict_output, word_vocabulary, char_set_path)
+        self.model.prepare(gram_dict_input, gram_dict_output, word_vocabulary, char_set_path,
+                           tag_cache_dump_path=tag_cache_path)
         self.model.load_eval(self.build_config, eval_model_config_path, eval_model_weights_path)
 
     def predict(self, words: List[str], include_all_forms: bool = False) -> List[WordFormOut]:
@@ -47,8 +51,9 @@ class MorphParser(Predictor):
     def __get_sentence_forms(self, words: List[str], words_probabilities: List[List[float]],
                              include_all_forms: bool) -> List[WordFormOut]:
         result = []
+        unknown_label = self.model.grammeme_vectorizer_output.unknown_label()
         for word, word_prob in zip(words, words_probabilities[-len(words):]):
-            result.append(self.__compose_out_form(word, word_prob[1:], include_all_forms))
+            result.append(self.__compose_out_form(word, word_prob[1:unknown_label], include_all_forms))
         return result
 
     def __compose_out_form(self, word: str, probabilities: List[float],
@@ -87,8 +92,7 @@ class MorphParser(Predictor):
         guess = ""
         max_common_tags = 0
         for word_form in word_forms:
-            word_form_pos_tag, word_form_gram = convert_from_opencorpora_tag(self.converter, word_form.tag, word)
-            word_form_gram = process_gram_tag(word_form_gram)
+            word_form_pos_tag, word_form_gram = convert_tag(self.converter, word_form.tag, word)
             common_tags_len = len(set(word_form_gram.split("|")).intersection(set(gram.split("|"))))
             if common_tags_len > max_common_tags and word_form_pos_tag == pos_tag:
                 max_common_tags = common_tags_len
@@ -0,0 +1,46 @@
+from typing import List
+
+import numpy as np
+
+
+class CharEncoder(object):
+    def __init__(self, char_set: str):
+        self.char_set = char_set
+        self.unknown_index = len(char_set)
+        max_code = max([ord(ch) for ch in char_set]) if char_set else 0
+        self.table = np.full(max_code + 2, self.unknown_index, dtype=np.int64)
+        for index, ch in reversed(list(enumerate(char_set))):
+            self.table[ord(ch)] = index
+
+    def encode_words(self, words: List[str], max_word_length: int, dtype=np.int) -> np.array:
+        chars = np.zeros((len(words), max_word_length), dtype=dtype)
+        self.__fill(chars, words, np.arange(len(words)))
+        return chars
+
+    def encode_sentences(self, sentences: List[List[str]], max_word_length: int,
+                         sentence_len: int = None, dtype=np.int) -> np.array:
+        if sentence_len is None:
+            sentence_len = max([len(sentence) for sentence in sentences]) if sentences else 0
+        chars = np.zeros((len(sentences), sentence_len, max_word_length), dtype=dtype)
+        words = []
+        rows = []
+        for i, sentence in enumerate(sentences):
+            first_row = i * sentence_len + sentence_len - len(sentence)
+            words.extend(sentence)
+            rows.extend(range(first_row, first_row + len(sentence)))
+        self.__fill(chars.reshape((-1, max_word_length)), words, np.array(rows, dtype=np.int64))
+        return chars
+
+    def __fill(self, chars: np.array, words: List[str], rows: np.array) -> None:
+        max_word_length = chars.shape[1]
+        if not words or max_word_length == 0:
+            return
+        words = [word[-max_word_length:] for word in words]
+        lengths = np.array([len(word) for word in words], dtype=np.int64)
+        codes = np.frombuffer("".join(words).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        indices = self.table[np.minimum(codes, len(self.table) - 1)]
+
+        word_lengths = np.repeat(lengths, lengths)
+        word_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        columns = max_word_length - word_lengths + np.arange(len(codes)) - word_starts
+        chars[np.repeat(rows, lengths), columns] = indices
@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+from typing import List
+
+import numpy as np
+from pymorphy2 import MorphAnalyzer
+from russian_tagsets import converters
+from tqdm import tqdm
+
+from engine.generator import BatchGenerator, FeaturePlan
+from engine.preparation.vocab import WordVocabulary
+from engine.preparation.gram_vector import GrammemeVectorizer
+from engine.preparation.char_encoder import CharEncoder
+from engine.preparation.corpus_index import CorpusIndex
+from engine.model_object import ConfigModel
+
+
+class SentenceSpan(object):
+    __slots__ = ("index", "start", "end")
+
+    def __init__(self, index: int, start: int, end: int):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+
+class CompiledCorpus(object):
+    VERSION = 2
+    HEADER_FILENAME = "header.json"
+    ARRAYS = ("word_ids", "type_ids", "tag_labels", "sentence_offsets", "sentence_lengths", "gram_table", "char_table")
+    FEATURIZE_CHUNK_SIZE = 10000
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.header = None
+        self.word_ids = None
+        self.type_ids = None
+        self.tag_labels = None
+        self.sentence_offsets = None
+        self.sentence_lengths = None
+        self.gram_table = None
+        self.char_table = None
+
+    def sentences_count(self) -> int:
+        return len(self.sentence_offsets)
+
+    def get_span(self, index: int) -> SentenceSpan:
+        start = int(self.sentence_offsets[index])
+        return SentenceSpan(index, start, start + int(self.sentence_lengths[index]))
+
+    def get_tensors(self, spans: List[SentenceSpan], dtypes, plan):
+        n = len(spans)
+        sentence_max_len = max([len(span) for span in spans])
+        lengths = np.array([len(span) for span in spans], dtype=np.int64)
+        starts = np.array([span.start for span in spans], dtype=np.int64)
+        inner = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        tokens = np.repeat(starts, lengths) + inner
+        rows = np.repeat(np.arange(n), lengths)
+        columns = np.repeat(sentence_max_len - lengths, lengths) + inner
+        type_ids = self.type_ids[tokens] if plan.gram or plan.chars else None
+
+        words = None
+        grammemes = None
+        chars = None
+        if plan.words:
+            words = np.zeros((n, sentence_max_len), dtype=dtypes.word)
+            words[rows, columns] = self.word_ids[tokens]
+        if plan.gram:
+            grammemes = np.zeros((n, sentence_max_len, self.gram_table.shape[1]), dtype=dtypes.gram)
+            grammemes[rows, columns] = self.gram_table[type_ids]
+        if plan.chars:
+            chars = np.zeros((n, sentence_max_len, self.char_table.shape[1]), dtype=dtypes.char)
+            chars[rows, columns] = self.char_table[type_ids]
+        y = np.zeros((n, sentence_max_len), dtype=dtypes.tag)
+        y[rows, columns] = self.tag_labels[tokens]
+        return words, grammemes, chars, y
+
+    def __getstate__(self):
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+        self.load()
+
+    def load_header(self) -> None:
+        with open(os.path.join(self.directory, CompiledCorpus.HEADER_FILENAME), "r", encoding="utf-8") as f:
+            self.header = json.loads(f.read())
+
+    def load(self) -> None:
+        self.load_header()
+        for name in CompiledCorpus.ARRAYS:
+            setattr(self, name, np.load(self.__get_array_path(name), mmap_mode="r"))
+
+    def unknown_tags_count(self) -> int:
+        return self.header.get("unknown_tags", 0)
+
+    def is_actual(self, header) -> bool:
+        stored = {key: value for key, value in self.header.items() if key != "unknown_tags"}
+        return stored == header
+
+    def compile(self, file_names: List[str],
+                grammeme_vectorizer_input: GrammemeVectorizer,
+                grammeme_vectorizer_output: GrammemeVectorizer,
+                word_vocabulary: WordVocabulary,
+                char_set: str,
+                build_config: ConfigModel) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        header_path = os.path.join(self.directory, CompiledCorpus.HEADER_FILENAME)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+
+        indices = CorpusIndex.load_all(file_names, strict=True)
+        lengths = np.concatenate([index.lengths for index in indices]).astype(np.int32) \
+            if indices else np.zeros(0, dtype=np.int32)
+        offsets = np.cumsum(lengths, dtype=np.int64) - lengths
+        tokens_count = int(lengths.sum())
+        self.__save_array("sentence_lengths", lengths)
+        self.__save_array("sentence_offsets", offsets)
+
+        type_ids = self.__open_array("type_ids", (tokens_count,), np.int32)
+        tag_labels = self.__open_array("tag_labels", (tokens_count,), np.int32)
+        word_types = {}
+        position = 0
+        for index in indices:
+            with tqdm(total=index.sentences_count(), unit="sent", desc="compile") as pb:
+                for lines in index.read_sentences(np.arange(index.sentences_count())):
+                    pb.update(1)
+                    for line in lines:
+                        word, _, pos, tags = line.strip().split('\t')[0:4]
+                        type_ids[position] = word_types.setdefault(word, len(word_types))
+                        tag_labels[position] = grammeme_vectorizer_output.get_label_by_name(pos + "#" + tags)
+                        position += 1
+        type_ids.flush()
+        tag_labels.flush()
+
+        types = [word for word, _ in sorted(word_types.items(), key=lambda x: x[1])]
+        plan = BatchGenerator.get_feature_plan(build_config)
+        plan = FeaturePlan(words=True, gram=plan.gram, chars=True)
+        morph = MorphAnalyzer()
+        converter = converters.converter('opencorpora-int', 'ud14')
+        type_word_ids = np.zeros(len(types), dtype=np.int32)
+        gram_table = self.__open_array("gram_table", (len(types), grammeme_vectorizer_input.grammemes_count()),
+                                       np.float32)
+        for start in range(0, len(types), CompiledCorpus.FEATURIZE_CHUNK_SIZE):
+            chunk = types[start:start + CompiledCorpus.FEATURIZE_CHUNK_SIZE]
+            features = BatchGenerator.get_words_features(
+                chunk,
+                converter=converter,
+                morph=morph,
+                grammeme_vectorizer=grammeme_vectorizer_input,
+                word_vocabulary=word_vocabulary,
+                word_count=build_config.word_max_count,
+                plan=plan)
+            for i, (word_index, gram_vector) in enumerate(features):
+                type_word_ids[start + i] = word_index
+                if plan.gram:
+                    gram_table[start + i] = gram_vector
+        gram_table.flush()
+        self.__save_array("char_table", CharEncoder(char_set).encode_words(
+            types, build_config.char_max_word_length, dtype=np.int32))
+        self.__save_array("word_ids", type_word_ids[np.asarray(type_ids)])
+
+        header = self.get_header(file_names, grammeme_vectorizer_input, grammeme_vectorizer_output,
+                                 word_vocabulary, char_set, build_config)
+        unknown_label = grammeme_vectorizer_output.unknown_label()
+        header["unknown_tags"] = int(np.count_nonzero(np.asarray(tag_labels) == unknown_label))
+        with open(header_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, sort_keys=True, indent=4) + "\n")
+        self.load()
+
+    @staticmethod
+    def get_header(file_names: List[str],
+                   grammeme_vectorizer_input: GrammemeVectorizer,
+                   grammeme_vectorizer_output: GrammemeVectorizer,
+                   word_vocabulary: WordVocabulary,
+                   char_set: str,
+                   build_config: ConfigModel):
+        sources = []
+        for filename, index in zip(file_names, CorpusIndex.load_all(file_names)):
+            sources.append({"path": os.path.abspath(filename), "size": index.file_size, "mtime": index.file_mtime,
+                            "hash": index.content_hash})
+        return {
+            "version": CompiledCorpus.VERSION,
+            "sources": sources,
+            "gram_input": CompiledCorpus.get_vectorizer_version(grammeme_vectorizer_input),
+            "gram_output": CompiledCorpus.get_vectorizer_version(grammeme_vectorizer_output),
+            "vocabulary": CompiledCorpus.get_hash("\n".join(word_vocabulary.words[:build_config.word_max_count])),
+            "char_set": CompiledCorpus.get_hash(char_set),
+            "word_max_count": build_config.word_max_count,
+            "char_max_word_length": build_config.char_max_word_length,
+            "use_gram": bool(build_config.use_gram)
+        }
+
+    @staticmethod
+    def get_vectorizer_version(vectorizer: GrammemeVectorizer) -> str:
+        names = sorted(vectorizer.name_to_index.items(), key=lambda x: x[1])
+        return CompiledCorpus.get_hash(json.dumps([names, vectorizer.get_ordered_grammemes()]))
+
+    @staticmethod
+    def get_hash(text: str) -> str:
+        return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def load_or_compile(directory: str, file_names: List[str],
+                        grammeme_vectorizer_input: GrammemeVectorizer,
+                        grammeme_vectorizer_output: GrammemeVectorizer,
+                        word_vocabulary: WordVocabulary,
+                        char_set: str,
+                        build_config: ConfigModel) -> 'CompiledCorpus':
+        corpus = CompiledCorpus(directory)
+        header = CompiledCorpus.get_header(file_names, grammeme_vectorizer_input, grammeme_vectorizer_output,
+                                           word_vocabulary, char_set, build_config)
+        if os.path.exists(os.path.join(directory, CompiledCorpus.HEADER_FILENAME)):
+            corpus.load_header()
+            if corpus.is_actual(header):
+                corpus.load()
+                return corpus
+        corpus.compile(file_names, grammeme_vectorizer_input, grammeme_vectorizer_output,
+                       word_vocabulary, char_set, build_config)
+        return corpus
+
+    def __open_array(self, name: str, shape, dtype) -> np.array:
+        return np.lib.format.open_memmap(self.__get_array_path(name), mode="w+", dtype=dtype, shape=shape)
+
+    def __save_array(self, name: str, array: np.array) -> None:
+        np.save(self.__get_array_path(name), array)
+
+    def __get_array_path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".npy")
@@ -1,4 +1,4 @@
-from engine.preparation.tagged import process_gram_tag
+from engine.preparation.gram_vector import GrammemeVectorizer
 
 
 class UDConverter:
@@ -20,7 +20,7 @@ class UDConverter:
                     gram = records[5]
                 else:
                     gram = records[4]
-                gram = process_gram_tag(gram)
+                gram = GrammemeVectorizer.get_canonical_gram(gram)
                 if pos == "PUNCT" and not with_punct:
                     continue
                 if add_number:
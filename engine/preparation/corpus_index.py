@@ -0,0 +1,127 @@
+import os
+import hashlib
+from typing import Iterator, List
+
+import numpy as np
+
+
+class CorpusIndex(object):
+    INDEX_SUFFIX = ".index.npz"
+
+    def __init__(self):
+        self.file_name = None
+        self.file_size = None
+        self.file_mtime = None
+        self.content_hash = None
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.histogram = np.zeros(0, dtype=np.int64)
+
+    def build(self, file_name: str) -> 'CorpusIndex':
+        offsets = []
+        lengths = []
+        position = 0
+        start = 0
+        tokens = 0
+        content_hash = hashlib.md5()
+        with open(file_name, "rb") as f:
+            for line in f:
+                content_hash.update(line)
+                position += len(line)
+                if len(line.decode("utf-8").strip()) == 0:
+                    offsets.append(start)
+                    lengths.append(tokens)
+                    start = position
+                    tokens = 0
+                else:
+                    tokens += 1
+        self.file_name = file_name
+        self.file_size, self.file_mtime = self.get_file_stamp(file_name)
+        self.content_hash = content_hash.hexdigest()
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int32)
+        self.histogram = np.bincount(self.lengths).astype(np.int64)
+        return self
+
+    def sentences_count(self) -> int:
+        return len(self.offsets)
+
+    def tokens_count(self) -> int:
+        return int(self.lengths.sum())
+
+    def is_actual(self, file_name: str, strict: bool = False) -> bool:
+        if (self.file_size, self.file_mtime) != self.get_file_stamp(file_name):
+            return False
+        return not strict or self.content_hash == self.get_content_hash(file_name)
+
+    def read_sentences(self, indices: np.array) -> Iterator[List[str]]:
+        with open(self.file_name, "rb") as f:
+            for index in indices:
+                f.seek(int(self.offsets[index]))
+                yield [f.readline().decode("utf-8") for _ in range(int(self.lengths[index]))]
+
+    def save(self, dump_filename: str) -> None:
+        with open(dump_filename, "wb") as f:
+            np.savez(f, offsets=self.offsets, lengths=self.lengths, histogram=self.histogram,
+                     stamp=np.array([self.file_size, self.file_mtime], dtype=np.int64),
+                     content_hash=np.array(self.content_hash))
+
+    def load(self, dump_filename: str, file_name: str) -> None:
+        with np.load(dump_filename) as data:
+            self.offsets = data["offsets"]
+            self.lengths = data["lengths"]
+            self.file_size, self.file_mtime = [int(value) for value in data["stamp"]]
+            if "content_hash" in data.files:
+                self.content_hash = str(data["content_hash"])
+                self.histogram = data["histogram"]
+            else:
+                self.file_size = None
+        self.file_name = file_name
+
+    @staticmethod
+    def get_file_stamp(file_name: str):
+        stat = os.stat(file_name)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def get_content_hash(file_name: str) -> str:
+        content_hash = hashlib.md5()
+        with open(file_name, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def get_index_path(file_name: str) -> str:
+        return file_name + CorpusIndex.INDEX_SUFFIX
+
+    @staticmethod
+    def load_or_build(file_name: str, strict: bool = False) -> 'CorpusIndex':
+        index = CorpusIndex()
+        dump_filename = CorpusIndex.get_index_path(file_name)
+        if os.path.exists(dump_filename):
+            index.load(dump_filename, file_name)
+            if index.is_actual(file_name, strict):
+                return index
+        index.build(file_name)
+        try:
+            index.save(dump_filename)
+        except OSError:
+            pass
+        return index
+
+    @staticmethod
+    def load_all(file_names: List[str], strict: bool = False) -> List['CorpusIndex']:
+        return [CorpusIndex.load_or_build(file_name, strict) for file_name in file_names]
+
+    @staticmethod
+    def count_sentences(file_names: List[str]) -> int:
+        return sum([index.sentences_count() for index in CorpusIndex.load_all(file_names)])
+
+    @staticmethod
+    def get_histogram(file_names: List[str]) -> np.array:
+        histograms = [index.histogram for index in CorpusIndex.load_all(file_names)]
+        histogram = np.zeros(max([len(h) for h in histograms] + [0]), dtype=np.int64)
+        for h in histograms:
+            histogram[:len(h)] += h
+        return histogram
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+WordFeatures = Tuple[int, np.array]
+
+
+class WordFeatureCache(object):
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.storage = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word: str) -> Optional[WordFeatures]:
+        features = self.storage.get(word)
+        if features is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.storage.move_to_end(word)
+        return features
+
+    def put(self, word: str, features: WordFeatures) -> None:
+        if self.max_size <= 0:
+            return
+        self.storage[word] = features
+        self.storage.move_to_end(word)
+        while len(self.storage) > self.max_size:
+            self.storage.popitem(last=False)
+
+    def resize(self, max_size: int) -> None:
+        self.max_size = max_size
+        while len(self.storage) > max(self.max_size, 0):
+            self.storage.popitem(last=False)
+
+    def clear(self) -> None:
+        self.storage.clear()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return float(self.hits) / total if total != 0 else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self.storage),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate()
+        }
+
+    def __len__(self):
+        return len(self.storage)
+
+    def __repr__(self):
+        return "<WordFeatureCache size={}; hits={}; misses={}; hit_rate={}>"\
+            .format(len(self.storage), self.hits, self.misses, "%0.4f" % self.hit_rate())
@@ -1,11 +1,16 @@
 import jsonpickle
-from collections import defaultdict
+import numpy as np
+from collections import defaultdict, Counter
+from functools import lru_cache
 from typing import Dict, List, Set
 
 from engine.dop.t_open import tqdm_open
 from engine.preparation.tagged import process_gram_tag
 
 
+CANONICAL_GRAM_CACHE_SIZE = 100000
+
+
 def get_empty_category():
     return {GrammemeVectorizer.UNKNOWN_VALUE}
 
@@ -13,11 +18,15 @@ def get_empty_category():
 class GrammemeVectorizer(object):
 
     UNKNOWN_VALUE = "Unknown"
+    UNKNOWN_INDEX = -1
+    FINALIZED_FIELDS = ("matrix", "grammemes_number", "category_offsets", "category_lengths", "index_to_name")
+    CACHE_FIELDS = ("name_index_cache", "unknown_names")
 
     def __init__(self):
         self.all_grammemes = defaultdict(get_empty_category)
         self.vectors = []
         self.name_to_index = {}
+        self.__reset_finalized()
 
     def collect_grammemes(self, filename: str) -> None:
 
@@ -31,9 +40,11 @@ class GrammemeVectorizer(object):
 
     def add_grammemes(self, pos_tag: str, gram: str) -> int:
 
-        gram = process_gram_tag(gram)
+        gram = self.get_canonical_gram(gram)
         vector_name = pos_tag + '#' + gram
         if vector_name not in self.name_to_index:
+            assert not self.is_finalized(), "Finalized vectorizer can't be extended"
+            self.name_index_cache = {}
             self.name_to_index[vector_name] = len(self.name_to_index)
             self.all_grammemes["POS"].add(pos_tag)
             gram = gram.split("|") if gram != "_" else []
@@ -51,17 +62,77 @@ class GrammemeVectorizer(object):
             grammemes = grammemes.split("|") if grammemes != "_" else []
             vector = self.__build_vector(pos_tag, grammemes)
             self.vectors.append(vector)
+        self.finalize()
+
+    def finalize(self) -> 'GrammemeVectorizer':
+
+        self.__reset_finalized()
+        ordered_grammemes = self.get_ordered_grammemes()
+        lengths = [len(values) for _, values in sorted(self.all_grammemes.items(), key=lambda x: x[0])]
+        offsets = np.cumsum([0] + lengths[:-1]) if lengths else np.zeros(0)
+        matrix = np.array(self.vectors, dtype=np.float32).reshape((len(self.vectors), len(ordered_grammemes)))
+        matrix.setflags(write=False)
+
+        self.grammemes_number = len(ordered_grammemes)
+        self.category_lengths = np.array(lengths, dtype=np.int64)
+        self.category_offsets = np.array(offsets, dtype=np.int64)
+        self.index_to_name = [name for name, _ in sorted(self.name_to_index.items(), key=lambda x: x[1])]
+        self.matrix = matrix
+        return self
+
+    def is_finalized(self) -> bool:
+        return self.matrix is not None
 
     def get_vector(self, vector_name: str) -> List[int]:
 
+        if self.is_finalized():
+            index = self.name_to_index.get(vector_name)
+            return self.matrix[index] if index is not None else np.zeros(self.grammemes_number, dtype=np.float32)
         if vector_name not in self.name_to_index:
             return [0] * len(self.vectors[0])
         return self.vectors[self.name_to_index[vector_name]]
 
     def get_vector_by_index(self, index: int) -> List[int]:
 
+        if self.is_finalized():
+            if 0 <= index < self.matrix.shape[0]:
+                return self.matrix[index]
+            return np.zeros(self.grammemes_number, dtype=np.float32)
         return self.vectors[index] if 0 <= index < len(self.vectors) else [0] * len(self.vectors[0])
 
+    def get_summed_vectors(self, names_list: List[List[str]]) -> np.array:
+
+        rows = []
+        owners = []
+        for i, names in enumerate(names_list):
+            for name in names:
+                index = self.name_to_index.get(name)
+                if index is not None:
+                    rows.append(index)
+                    owners.append(i)
+        summed = np.zeros((len(names_list), self.grammemes_count()), dtype=np.float32)
+        if rows:
+            np.add.at(summed, np.array(owners), self.matrix[np.array(rows)])
+        return summed
+
+    def normalize(self, vectors: np.array) -> np.array:
+
+        if vectors.shape[-1] == 0:
+            return vectors
+        sums = np.add.reduceat(vectors, self.category_offsets, axis=-1)
+        sums = np.repeat(sums, self.category_lengths, axis=-1)
+        return np.divide(vectors, sums, out=np.zeros_like(vectors), where=sums != 0)
+
+    @staticmethod
+    def to_sparse(vectors: np.array):
+
+        nonzero = vectors != 0
+        k = max(int(nonzero.sum(axis=-1).max()) if vectors.size != 0 else 0, 1)
+        order = np.argsort(~nonzero, axis=-1, kind="stable")[..., :k]
+        weights = np.take_along_axis(vectors, order, axis=-1)
+        indices = np.where(weights != 0, order, 0).astype(np.int32)
+        return indices, weights
+
     def get_ordered_grammemes(self) -> List[str]:
 
         flat = []
@@ -75,19 +146,50 @@ class GrammemeVectorizer(object):
         return len(self.vectors)
 
     def grammemes_count(self) -> int:
+        if self.grammemes_number is not None:
+            return self.grammemes_number
         return len(self.get_ordered_grammemes())
 
     def is_empty(self) -> int:
         return len(self.vectors) == 0
 
     def get_name_by_index(self, index):
+        if self.index_to_name is not None:
+            return self.index_to_name[index]
         d = {index: name for name, index in self.name_to_index.items()}
         return d[index]
 
     def get_index_by_name(self, name):
-        pos = name.split("#")[0]
-        gram = process_gram_tag(name.split("#")[1])
-        return self.name_to_index[pos + "#" + gram]
+        index = self.name_index_cache.get(name)
+        if index is None:
+            pos = name.split("#")[0]
+            gram = self.get_canonical_gram(name.split("#")[1])
+            index = self.name_to_index.get(pos + "#" + gram, GrammemeVectorizer.UNKNOWN_INDEX)
+            self.name_index_cache[name] = index
+        if index == GrammemeVectorizer.UNKNOWN_INDEX:
+            self.unknown_names[name] += 1
+        return index
+
+    def get_label_by_name(self, name) -> int:
+        index = self.get_index_by_name(name)
+        return index + 1 if index != GrammemeVectorizer.UNKNOWN_INDEX else self.unknown_label()
+
+    def unknown_label(self) -> int:
+        return self.size() + 1
+
+    def classes_count(self) -> int:
+        return self.size() + 2
+
+    def unknown_count(self) -> int:
+        return sum(self.unknown_names.values())
+
+    def reset_unknown_count(self) -> None:
+        self.unknown_names = Counter()
+
+    @staticmethod
+    @lru_cache(maxsize=CANONICAL_GRAM_CACHE_SIZE)
+    def get_canonical_gram(gram: str) -> str:
+        return process_gram_tag(gram)
 
     def __build_vector(self, pos_tag: str, grammemes: List[str]) -> List[int]:
 
@@ -102,6 +204,24 @@ class GrammemeVectorizer(object):
                 vector += [1 if value == gram_tags[category] else 0 for value in sorted(list(values))]
         return vector
 
+    def __reset_finalized(self) -> None:
+        for field in GrammemeVectorizer.FINALIZED_FIELDS:
+            setattr(self, field, None)
+        self.name_index_cache = {}
+        self.unknown_names = Counter()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for field in GrammemeVectorizer.FINALIZED_FIELDS + GrammemeVectorizer.CACHE_FIELDS:
+            state.pop(field, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__reset_finalized()
+        if not self.is_empty():
+            self.finalize()
+
     def save(self, dump_filename: str) -> None:
         with open(dump_filename, "w") as f:
             f.write(jsonpickle.encode(self, f))
@@ -109,4 +229,8 @@ class GrammemeVectorizer(object):
     def load(self, dump_filename: str):
         with open(dump_filename, "r") as f:
             vectorizer = jsonpickle.decode(f.read())
-            self.__dict__.update(vectorizer.__dict__)
+            state = vectorizer.__getstate__()
+            self.__dict__.update(state)
+        self.__reset_finalized()
+        if not self.is_empty():
+            self.finalize()
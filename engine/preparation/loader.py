@@ -5,7 +5,7 @@ from russian_tagsets import converters
 from engine.preparation.gram_vector import GrammemeVectorizer
 from engine.preparation.vocab import WordVocabulary
 from engine.dop.t_open import tqdm_open
-from engine.preparation.tagged import convert_from_opencorpora_tag, process_gram_tag
+from engine.preparation.tagged import convert_tag
 
 
 class Loader(object):
@@ -39,6 +39,5 @@ class Loader(object):
         self.grammeme_vectorizer_output.add_grammemes(pos_tag, grammemes)
         if self.language == "ru":
             for parse in self.morph.parse(text):
-                pos, gram = convert_from_opencorpora_tag(self.converter, parse.tag, text)
-                gram = process_gram_tag(gram)
+                pos, gram = convert_tag(self.converter, parse.tag, text)
                 self.grammeme_vectorizer_input.add_grammemes(pos, gram)
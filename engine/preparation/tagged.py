@@ -1,3 +1,7 @@
+import json
+from typing import Dict, Tuple
+
+
 def convert_from_opencorpora_tag(to_ud, tag: str, text: str):
     ud_tag = to_ud(str(tag), text)
     pos = ud_tag.split()[0]
@@ -10,3 +14,51 @@ def process_gram_tag(gram: str):
     dropped = ["Animacy", "Aspect", "NumType"]
     gram = [grammem for grammem in gram if sum([drop in grammem for drop in dropped]) == 0]
     return "|".join(sorted(gram)) if gram else "_"
+
+
+class TagCache(object):
+    # opencorpora-int -> ud14 conversion depends on the tag only, the word is ignored by the converter,
+    # so the tag string is a complete key.
+    def __init__(self):
+        self.tags = {}  # type: Dict[str, Tuple[str, str]]
+
+    def convert(self, to_ud, tag, text: str) -> Tuple[str, str]:
+        key = str(tag)
+        result = self.tags.get(key)
+        if result is None:
+            pos, gram = convert_from_opencorpora_tag(to_ud, key, text)
+            result = (pos, process_gram_tag(gram))
+            self.tags[key] = result
+        return result
+
+    def precompute(self, to_ud, morph) -> None:
+        for tag in morph.dictionary.gramtab:
+            self.convert(to_ud, tag, "")
+
+    def clear(self) -> None:
+        self.tags.clear()
+
+    def save(self, dump_filename: str) -> None:
+        with open(dump_filename, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.tags, ensure_ascii=False, sort_keys=True, indent=0) + "\n")
+
+    def load(self, dump_filename: str) -> None:
+        with open(dump_filename, "r", encoding="utf-8") as f:
+            self.tags.update({key: tuple(value) for key, value in json.loads(f.read()).items()})
+
+    def load_or_precompute(self, dump_filename: str, to_ud, morph) -> None:
+        try:
+            self.load(dump_filename)
+        except (OSError, ValueError):
+            self.precompute(to_ud, morph)
+            self.save(dump_filename)
+
+    def __len__(self):
+        return len(self.tags)
+
+
+tag_cache = TagCache()
+
+
+def convert_tag(to_ud, tag, text: str) -> Tuple[str, str]:
+    return tag_cache.convert(to_ud, tag, text)
@@ -0,0 +1,58 @@
+import tensorflow as tf
+from keras.layers import Layer
+from keras import backend as K
+
+from engine.dop.model_config import rewrite_layers
+
+
+class SampledSoftmax(Layer):
+    def __init__(self, units, num_sampled, sampled=True, use_bias=True, **kwargs):
+        super().__init__(**kwargs)
+        self.units = units
+        self.num_sampled = num_sampled
+        self.sampled = sampled
+        self.use_bias = use_bias
+
+    def build(self, input_shape):
+        self.kernel = self.add_weight(shape=(self.units, input_shape[-1]), initializer='glorot_uniform',
+                                      name='kernel')
+        self.bias = self.add_weight(shape=(self.units,), initializer='zeros', name='bias') if self.use_bias else None
+        super().build(input_shape)
+
+    def call(self, inputs, **kwargs):
+        if self.sampled:
+            return inputs
+        logits = tf.matmul(K.reshape(inputs, (-1, K.int_shape(inputs)[-1])), self.kernel, transpose_b=True)
+        if self.use_bias:
+            logits = K.bias_add(logits, self.bias)
+        return K.reshape(K.softmax(logits), tf.concat([K.shape(inputs)[:-1], [self.units]], 0))
+
+    def sampled_loss(self, y_true, y_pred):
+        labels = K.reshape(K.cast(y_true, 'int64'), (-1, 1))
+        inputs = K.reshape(y_pred, (-1, K.int_shape(y_pred)[-1]))
+        biases = self.bias if self.use_bias else tf.zeros((self.units,))
+        losses = tf.nn.sampled_softmax_loss(weights=self.kernel, biases=biases, labels=labels, inputs=inputs,
+                                            num_sampled=self.num_sampled, num_classes=self.units)
+        return K.reshape(losses, K.shape(y_true)[:-1])
+
+    def compute_output_shape(self, input_shape):
+        if self.sampled:
+            return input_shape
+        return tuple(input_shape[:-1]) + (self.units,)
+
+    def get_config(self):
+        config = {'units': self.units, 'num_sampled': self.num_sampled, 'sampled': self.sampled,
+                  'use_bias': self.use_bias}
+        base_config = super().get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+def get_head_loss(layer: Layer):
+    if isinstance(layer, SampledSoftmax) and layer.sampled:
+        return layer.sampled_loss
+    return 'sparse_categorical_crossentropy'
+
+
+def set_full_softmax(model_config: str) -> str:
+    return rewrite_layers(model_config, lambda node: node["class_name"] == "SampledSoftmax",
+                          lambda node: node["config"].update(sampled=False))
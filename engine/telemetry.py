@@ -0,0 +1,72 @@
+import sys
+import json
+import time
+import threading
+from collections import defaultdict
+from typing import Dict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class Telemetry(object):
+    def __init__(self, file_name: str = None, buffer_size: int = 100):
+        self.file_name = file_name
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.stages = defaultdict(float)
+        self.lock = threading.Lock()
+        self.last_record_time = time.time()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.stages[stage] += seconds
+
+    def add_timings(self, timings: Dict[str, float]) -> None:
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.stages[stage] += seconds
+
+    def record(self, event: str, **values) -> Dict:
+        now = time.time()
+        seconds = now - self.last_record_time
+        self.last_record_time = now
+        with self.lock:
+            stages, self.stages = dict(self.stages), defaultdict(float)
+        record = {"time": now, "event": event, "seconds": seconds, "stages": stages,
+                  "peak_rss_mb": self.get_peak_rss_mb()}
+        record.update(values)
+        if seconds > 0:
+            if "examples" in values:
+                record["examples_per_sec"] = values["examples"] / seconds
+            if "tokens" in values:
+                record["tokens_per_sec"] = values["tokens"] / seconds
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return record
+
+    def flush(self) -> None:
+        if self.file_name is not None and self.buffer:
+            with open(self.file_name, "a", encoding="utf-8") as f:
+                for record in self.buffer:
+                    f.write(json.dumps(record) + "\n")
+        self.buffer = []
+
+    @staticmethod
+    def get_peak_rss_mb() -> float:
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+            return max_rss / 1024.0 ** 2 if sys.platform == "darwin" else max_rss / 1024.0
+        if psutil is not None:
+            memory_info = psutil.Process().memory_info()
+            return getattr(memory_info, "peak_wset", memory_info.rss) / 1024.0 ** 2
+        return None
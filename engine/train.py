@@ -3,6 +3,7 @@ from typing import List
 from engine.model import LSTMMorphoAnalysis
 from engine.model_object import ConfigModel, ConfigTrain
 from engine.dop.embedding import load_embeddings
+from engine.dop.threads import configure_threads
 
 
 def train(file_names: List[str], train_config_path: str, build_config_path: str, embeddings_path: str = None):
@@ -10,9 +11,11 @@ def train(file_names: List[str], train_config_path: str, build_config_path: str,
     train_config.load(train_config_path)
     build_config = ConfigModel()
     build_config.load(build_config_path)
+    configure_threads(train_config.intra_op_threads, train_config.inter_op_threads, train_config.cpu_affinity)
     model = LSTMMorphoAnalysis()
     model.prepare(train_config.gram_dict_input, train_config.gram_dict_output,
-                  train_config.word_vocabulary, train_config.char_set_path, file_names)
+                  train_config.word_vocabulary, train_config.char_set_path, file_names,
+                  train_config.tag_cache_path)
 
     if os.path.exists(train_config.eval_model_config_path) and not train_config.rewrite_model:
         model.load_train(build_config, train_config.train_model_config_path, train_config.train_model_weights_path)
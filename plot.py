@@ -1,32 +1,64 @@
+import json
+from collections import defaultdict
+
 import matplotlib.pyplot as plt
 
 
-range_acc = 0
-range_loss = 0
-range_sentence = 0
-acc = []
-loss = []
-sentence = []
+batches = []
+epochs = []
 
-with open("engine/model/acc.txt", "r") as f:
+with open("engine/model/telemetry.jsonl", "r") as f:
     for i in f:
-        acc.append(float(i))
-        range_acc += 1
+        record = json.loads(i)
+        if record["event"] == "batch":
+            batches.append(record)
+        elif record["event"] == "epoch":
+            epochs.append(record)
 
-with open("engine/model/loss.txt", "r") as f:
-    for i in f:
-        loss.append(float(i))
-        range_loss += 1
+acc = [record["accuracy"] for record in batches]
+loss = [record["loss"] for record in batches]
+tokens_per_sec = [record.get("tokens_per_sec", 0) for record in batches]
+examples_per_sec = [record.get("examples_per_sec", 0) for record in batches]
 
 plt.figure(figsize=(8, 8))
 plt.subplot(1, 2, 1)
-plt.plot(range(range_acc), acc, label='Точность на обучении')
+plt.plot(range(len(acc)), acc, label='Точность на обучении')
 plt.legend(loc='lower right')
 plt.title('Точность')
 
 plt.subplot(1, 2, 2)
-plt.plot(range(range_loss), loss, label='Потери на обучении')
+plt.plot(range(len(loss)), loss, label='Потери на обучении')
 plt.legend(loc='upper right')
 plt.title('Потери')
 plt.savefig('./acc_loss.png')
-plt.show()
\ No newline at end of file
+
+plt.figure(figsize=(8, 8))
+plt.subplot(2, 1, 1)
+plt.plot(range(len(tokens_per_sec)), tokens_per_sec, label='Токенов в секунду')
+plt.legend(loc='lower right')
+plt.title('Производительность')
+
+plt.subplot(2, 1, 2)
+plt.plot(range(len(examples_per_sec)), examples_per_sec, label='Предложений в секунду')
+plt.legend(loc='lower right')
+plt.savefig('./throughput.png')
+
+stages = ["read", "featurize", "tensor", "fit", "checkpoint", "evaluate"]
+epoch_stages = defaultdict(lambda: defaultdict(float))
+for record in batches + epochs:
+    for stage, seconds in record["stages"].items():
+        epoch_stages[record["epoch"]][stage] += seconds
+epoch_numbers = sorted(epoch_stages)
+
+plt.figure(figsize=(8, 8))
+bottom = [0.0] * len(epoch_numbers)
+for stage in stages:
+    seconds = [epoch_stages[epoch][stage] for epoch in epoch_numbers]
+    plt.bar(epoch_numbers, seconds, bottom=bottom, label=stage)
+    bottom = [b + s for b, s in zip(bottom, seconds)]
+plt.legend(loc='upper right')
+plt.xlabel('Эпоха')
+plt.ylabel('Секунды')
+plt.title('Время по стадиям')
+plt.savefig('./stages.png')
+plt.show()
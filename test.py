@@ -16,7 +16,8 @@ morph = MorphParser(
     gram_dict_output="model/gram_output.json",
     word_vocabulary="model/vocabulary.txt",
     char_set_path="model/char_set.txt",
-    build_config="model/build_config.json")
+    build_config="model/build_config.json",
+    tag_cache_path="model/tag_cache.json")
 
 quality = tag_files(morph)
 